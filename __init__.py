@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 from . import models
+from . import populate
 
 # Hooks must be importable from the module namespace for Odoo to resolve
 # pre_init_hook / post_init_hook by name.
@@ -1,6 +1,6 @@
 {
     'name': 'sid_projects_dossier',
-    'version': '15.0.1.1.0',
+    'version': '15.0.1.2.0',
     'category': 'Sales',
     'license': 'AGPL-3',
     'summary': 'Gestión de Dossieres de Calidad',
@@ -9,17 +9,27 @@
     'depends': ['base','sale_management','documents','oct_sale_extra_fields', 'sid_bankbonds_mod'],
     'data': [
         'security/security.xml',
-        'security/ir.model.access.csv',
+        # Groups must exist before the ACLs that reference them
         'data/document_group.xml',
+        'security/ir.model.access.csv',
         'data/documents_tags.xml',
         'data/document_folders.xml',
+        'data/sid_dossier_template_data.xml',
 
         # Wizard actions/views must be loaded before views referencing them
         'data/sid_dossier_assign_wizard.xml',
+        'data/sid_dossier_queue_data.xml',
+        'data/sid_dossier_archive_data.xml',
+        'data/sid_dossier_index_data.xml',
 
         # Views / menus
         'views/sid_projects_dossier_sales.xml',
         'views/sid_projects_dossier_quotations.xml',
+        'views/sid_dossier_template_views.xml',
+        'views/sid_dossier_queue_views.xml',
+        'views/sid_dossier_stat_views.xml',
+        'views/sid_dossier_report_views.xml',
+        'views/sid_dossier_perf_views.xml',
 
         # Window actions / menus
         'data/document_actions.xml',
@@ -1,7 +1,13 @@
 # -*- coding: utf-8 -*-
+import logging
 from datetime import date
 
-from odoo import api, SUPERUSER_ID
+from odoo import api, tools, SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+# Rows per batch for the post-init SQL backfills.
+BACKFILL_CHUNK_SIZE = 5000
 
 
 def _pick_root_folder(Folder):
@@ -9,29 +15,34 @@ def _pick_root_folder(Folder):
 
     We intentionally accept spelling variants (Dosieres/Dossieres) and
     different casing, because the DB may already contain a manually created
-    folder.
+    folder. Names are scored in a single SQL query instead of loading every
+    root folder; ties keep the model order (sequence, id).
     """
-    # Root folders only
-    candidates = Folder.search([("parent_folder_id", "=", False)])
-    if not candidates:
-        return Folder
-
-    def score(name):
-        n = (name or "").strip().lower()
-        s = 0
-        if "calidad" in n:
-            s += 10
-        if "dosi" in n:  # dosieres/dossieres
-            s += 10
-        if "dossier" in n:
-            s += 5
-        if n in ("dosieres de calidad", "dossieres de calidad", "dossieres de calidad"):
-            s += 50
-        return s
-
-    best = max(candidates, key=lambda r: score(r.name))
+    Folder.flush(["parent_folder_id", "name", "sequence"])
+    Folder.env.cr.execute(
+        """
+        SELECT id
+          FROM (
+                SELECT id, sequence,
+                       CASE WHEN n LIKE '%%calidad%%' THEN 10 ELSE 0 END
+                     + CASE WHEN n LIKE '%%dosi%%' THEN 10 ELSE 0 END
+                     + CASE WHEN n LIKE '%%dossier%%' THEN 5 ELSE 0 END
+                     + CASE WHEN n IN %s THEN 50 ELSE 0 END AS score
+                  FROM (
+                        SELECT id, sequence, lower(btrim(name, E' \t\n\r')) AS n
+                          FROM documents_folder
+                         WHERE parent_folder_id IS NULL
+                  ) roots
+          ) scored
+         WHERE score > 0
+         ORDER BY score DESC, sequence, id
+         LIMIT 1
+        """,
+        (("dosieres de calidad", "dossieres de calidad"),),
+    )
+    row = Folder.env.cr.fetchone()
     # If nothing looks like dossiers, return empty recordset.
-    return best if score(best.name) > 0 else Folder
+    return Folder.browse(row[0]) if row else Folder
 
 
 def _ensure_xmlid(env, module, name, model, res_id):
@@ -69,31 +80,119 @@ def _bind_existing_folders(cr):
             _ensure_xmlid(env, module, "sid_workspace_quality_dossiers_%s" % yname, "documents.folder", yf.id)
 
 
-def pre_init_bind_quality_dossiers_folders(cr):
-    _bind_existing_folders(cr)
+def _commit_chunk(cr, auto_commit=True):
+    """Commit a finished batch so an interrupted install/upgrade can resume.
 
+    Skipped in test mode, where everything runs in a single transaction,
+    and when the caller disables auto_commit.
+    """
+    if auto_commit and not tools.config["test_enable"]:
+        cr.commit()
+
+
+def _backfill_batches(cr, query, label, chunk_size=BACKFILL_CHUNK_SIZE, auto_commit=True):
+    """Run `query` (an UPDATE ... RETURNING id over `id > %s`) batch by batch.
+
+    Keyset pagination: each batch starts after the last id of the previous
+    one, so rows already handled (and the dead tuples they left) are never
+    walked again and the total cost stays linear in the table size. Batches
+    still filter on pending rows, so a re-run after an interruption simply
+    skips what was committed.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        cr.execute(query, (last_id, chunk_size))
+        ids = [row[0] for row in cr.fetchall()]
+        if not ids:
+            break
+        last_id = max(ids)
+        total += len(ids)
+        _commit_chunk(cr, auto_commit)
+        _logger.info("Backfill %s: %s rows (last id %s)", label, total, last_id)
+    return total
+
+
+def _backfill_column_sql(cr, table, target, source, chunk_size=BACKFILL_CHUNK_SIZE, auto_commit=True):
+    """Copy `source` into `target` where `target` is empty, in SQL batches."""
+    if not (tools.column_exists(cr, table, target) and tools.column_exists(cr, table, source)):
+        return 0
+    query = """
+        UPDATE {table} SET {target} = {source}
+         WHERE id IN (
+                SELECT id FROM {table}
+                 WHERE id > %s
+                   AND ({target} IS NULL OR {target} = '')
+                   AND {source} IS NOT NULL AND {source} != ''
+                 ORDER BY id
+                 LIMIT %s
+         )
+     RETURNING id
+    """.format(table=table, target=target, source=source)
+    label = "%s.%s <- %s" % (table, target, source)
+    return _backfill_batches(cr, query, label, chunk_size, auto_commit)
+
+
+def _backfill_tiene_dossier_sql(cr, chunk_size=BACKFILL_CHUNK_SIZE, auto_commit=True):
+    """Set tiene_dossier on orders flagged with the legacy x_dossier, in batches.
+
+    Equivalent to the compute (dossier_folder_id or x_dossier) when x_dossier is set.
+    """
+    if not (tools.column_exists(cr, "sale_order", "x_dossier") and tools.column_exists(cr, "sale_order", "tiene_dossier")):
+        return 0
+    query = """
+        UPDATE sale_order SET tiene_dossier = TRUE
+         WHERE id IN (
+                SELECT id FROM sale_order
+                 WHERE id > %s
+                   AND x_dossier AND tiene_dossier IS NOT TRUE
+                 ORDER BY id
+                 LIMIT %s
+         )
+     RETURNING id
+    """
+    return _backfill_batches(cr, query, "sale_order.tiene_dossier <- x_dossier", chunk_size, auto_commit)
 
-def post_init_bind_quality_dossiers_folders(cr, registry):
-    # Keep it idempotent after install/upgrade too.
-    _bind_existing_folders(cr)
-    env = api.Environment(cr, SUPERUSER_ID, {})
 
-    SaleOrder = env["sale.order"].sudo().with_context(active_test=False)
-    Document = env["documents.document"].sudo().with_context(active_test=False)
+def _backfill_legacy_fields(env):
+    """Backfill tiene_dossier and the document description/transmittal from legacy fields.
+
+    Set-based UPDATEs: no per-document ORM write (nor its overrides/recomputes).
+    Called from the post-init hook and from the upgrade migration script.
+    """
+    cr = env.cr
+    SaleOrder = env["sale.order"]
+    Document = env["documents.document"]
 
     # Backfill sale.order.tiene_dossier from historical x_dossier flag.
     if "x_dossier" in SaleOrder._fields and "tiene_dossier" in SaleOrder._fields:
-        orders = SaleOrder.search([("x_dossier", "=", True)])
-        if orders:
-            orders._compute_tiene_dossier()
+        _backfill_tiene_dossier_sql(cr)
+        SaleOrder.invalidate_cache(["tiene_dossier"])
 
-    # Backfill document description/transmittal from legacy fields.
     if "x_name_2" in Document._fields and "document_description" in Document._fields:
-        docs_missing_description = Document.search([("document_description", "=", False), ("x_name_2", "!=", False)])
-        for doc in docs_missing_description:
-            doc.write({"document_description": doc.x_name_2})
+        _backfill_column_sql(cr, "documents_document", "document_description", "x_name_2")
 
     if "x_transmittal" in Document._fields and "document_transmittal" in Document._fields:
-        docs_missing_transmittal = Document.search([("document_transmittal", "=", False), ("x_transmittal", "!=", False)])
-        for doc in docs_missing_transmittal:
-            doc.write({"document_transmittal": doc.x_transmittal})
+        _backfill_column_sql(cr, "documents_document", "document_transmittal", "x_transmittal")
+
+    Document.invalidate_cache(["document_description", "document_transmittal"])
+
+
+def pre_init_bind_quality_dossiers_folders(cr):
+    _bind_existing_folders(cr)
+
+
+def post_init_bind_quality_dossiers_folders(cr, registry):
+    # Keep it idempotent after install/upgrade too.
+    _bind_existing_folders(cr)
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    _backfill_legacy_fields(env)
+
+    # Year folders are pre-created (then kept ahead by a monthly cron) and
+    # guarded by a unique (parent, name) index once the root is bound.
+    Folder = env["documents.folder"]
+    Folder._sid_ensure_dossier_unique_index()
+    Folder._cron_ensure_year_folders()
+
+    # Initial fill of the per-dossier statistics (maintained incrementally afterwards).
+    env["sid.dossier.stat"]._sid_rebuild()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+"""Re-run the legacy backfills on upgrade.
+
+post_init_hook only runs at install. The backfills are resumable, so if the
+upgrade is interrupted, running it again continues from the last committed batch.
+"""
+from odoo import api, SUPERUSER_ID
+
+from odoo.addons.sid_projects_dossier.hooks import _backfill_legacy_fields
+
+
+def migrate(cr, version):
+    if not version:
+        return
+    _backfill_legacy_fields(api.Environment(cr, SUPERUSER_ID, {}))
@@ -1,3 +1,12 @@
 from . import documents_folder_xmlid
+from . import sid_dossier_template
+from . import sid_dossier_perf
+from . import sid_projects_dossier_fields
 from . import sid_sale_quotations_dossier
 from . import sid_dossier_assign_wizard
+from . import sid_dossier_queue
+from . import sid_dossier_stat
+from . import sid_dossier_report
+from . import sid_dossier_archive
+# Último: crea índices sobre tablas/columnas de los modelos anteriores.
+from . import sid_dossier_indexes
@@ -1,11 +1,460 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, models, SUPERUSER_ID
+import logging
+from datetime import date
+
+import psycopg2
+from psycopg2 import errorcodes
+
+from odoo import api, fields, models, tools, SUPERUSER_ID, _
+
+_logger = logging.getLogger(__name__)
+
+QUALITY_ROOT_XMLIDS = (
+    "sid_projects_dossier.sid_workspace_quality_dossiers",
+    # Retrocompatibilidad: instalaciones antiguas pudieron usar este XML-ID.
+    "sid_projects_dossier.folder_root_dossieres_calidad",
+)
+QUALITY_ROOT_NAME = "Dossieres de calidad"
+# Workspace de dossieres archivados (Archivado/año/dossier).
+ARCHIVED_WORKSPACE_XMLID = "sid_projects_dossier.sid_workspace_archived"
+
+# Años por delante del actual que el cron deja creados.
+YEAR_FOLDERS_AHEAD = 1
+DOSSIER_UNIQUE_INDEX = "sid_documents_folder_dossier_uniq"
+# Otra transacción creó a la vez la misma carpeta: se resuelve repitiendo en una transacción nueva.
+CONCURRENT_CREATE_PGCODES = (errorcodes.SERIALIZATION_FAILURE, errorcodes.UNIQUE_VIOLATION)
+
+
+# Dossieres cuyo nombre, contrato o cliente contienen el término (cada rama
+# usa su índice trigram). Se añade al dominio del campo y a las reglas de acceso.
+_DOSSIER_PICKER_MATCH = """
+    ("documents_folder".normalized_name LIKE %s
+     OR "documents_folder".id IN (
+         SELECT q.dossier_folder_id
+           FROM sale_quotations q
+          WHERE q.dossier_folder_id IS NOT NULL
+            AND q.name ILIKE %s
+          UNION
+         SELECT q.dossier_folder_id
+           FROM res_partner p
+           JOIN sale_order so ON so.partner_id = p.id
+           JOIN sale_quotations q ON q.id = so.quotations_id
+          WHERE q.dossier_folder_id IS NOT NULL
+            AND p.name ILIKE %s
+     ))
+"""
+
+# Orden sobre los candidatos ya filtrados: primero las coincidencias exactas,
+# luego por prefijo y por último el resto, del año más reciente al más antiguo.
+_DOSSIER_PICKER_QUERY = """
+    SELECT f.id
+      FROM documents_folder f
+     WHERE f.id IN ({candidates})
+     ORDER BY CASE WHEN f.normalized_name = %s THEN 0
+                   WHEN f.normalized_name LIKE %s THEN 1
+                   ELSE 2
+              END,
+              f.dossier_year DESC, f.normalized_name, f.id
+     {limit}
+"""
+
+
+def normalize_folder_name(name):
+    """Nombre comparable entre años: sin espacios sobrantes y en minúsculas.
+
+    Equivale en SQL a lower(regexp_replace(btrim(name), '\\s+', ' ', 'g')).
+    """
+    return " ".join((name or "").split()).lower()
+
+
+def is_concurrent_create_error(error):
+    """True si `error` es un conflicto de creación concurrente de carpetas (reintentable)."""
+    return isinstance(error, psycopg2.Error) and error.pgcode in CONCURRENT_CREATE_PGCODES
+
+
+class IrModelData(models.Model):
+    _inherit = "ir.model.data"
+
+    def _sid_touches_quality_root(self):
+        return any(
+            data.module == "sid_projects_dossier" and data.model == "documents.folder"
+            for data in self
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        if records._sid_touches_quality_root():
+            self.env["documents.folder"].clear_caches()
+        return records
+
+    def write(self, vals):
+        touched = self._sid_touches_quality_root()
+        res = super().write(vals)
+        if touched or self._sid_touches_quality_root():
+            self.env["documents.folder"].clear_caches()
+        return res
+
+    def unlink(self):
+        touched = self._sid_touches_quality_root()
+        res = super().unlink()
+        if touched:
+            self.env["documents.folder"].clear_caches()
+        return res
 
 
 class DocumentsFolder(models.Model):
     _inherit = "documents.folder"
 
+    # Claves de dossier (root/año/dossier o Archivado/año/dossier) para detectar
+    # duplicados entre años con una búsqueda indexada (ver
+    # sid_documents_folder_dossier_name_idx).
+    is_dossier_folder = fields.Boolean(
+        string="Es dossier",
+        compute="_compute_sid_dossier_keys",
+        store=True,
+        readonly=True,
+    )
+    dossier_year = fields.Integer(
+        string="Año del dossier",
+        compute="_compute_sid_dossier_keys",
+        store=True,
+        readonly=True,
+    )
+    normalized_name = fields.Char(
+        string="Nombre normalizado",
+        compute="_compute_sid_dossier_keys",
+        store=True,
+        readonly=True,
+    )
+    dossier_archived = fields.Boolean(
+        string="Dossier archivado",
+        compute="_compute_sid_dossier_keys",
+        store=True,
+        readonly=True,
+    )
+
+    sid_request_pending = fields.Boolean(
+        string="Solicitud diferida",
+        copy=False,
+        help="Sección de dossier cuya solicitud de documentos se crea al subir el primer documento.",
+    )
+
+    @api.depends("name", "parent_folder_id", "parent_folder_id.name", "parent_folder_id.parent_folder_id")
+    def _compute_sid_dossier_keys(self):
+        workspace_ids = set(self._sid_dossier_workspace_ids())
+        archive_id = self._sid_archive_root_id()
+        for folder in self:
+            year = folder.parent_folder_id
+            year_name = (year.name or "").strip()
+            is_dossier = year.parent_folder_id.id in workspace_ids and year_name.isdigit()
+            folder.is_dossier_folder = is_dossier
+            folder.dossier_year = int(year_name) if is_dossier else 0
+            folder.normalized_name = normalize_folder_name(folder.name) if is_dossier else False
+            folder.dossier_archived = is_dossier and year.parent_folder_id.id == archive_id
+
+    # ---------------------------------------------------------------------
+    # Selector "Dossier existente" (contexto sid_dossier_picker)
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _name_search(self, name, args=None, operator="ilike", limit=100, name_get_uid=None):
+        if not self.env.context.get("sid_dossier_picker") or operator != "ilike":
+            return super()._name_search(name, args=args, operator=operator, limit=limit, name_get_uid=name_get_uid)
+        term = normalize_folder_name(name)
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        contains = "%" + escaped + "%"
+        self.env["sale.quotations"].flush(["name", "dossier_folder_id"])
+        # Primero se filtra (dominio del campo, reglas de acceso, coincidencia) y
+        # después se ordena y se aplica el límite del llamador.
+        query = self._search(
+            list(args or []) + [("is_dossier_folder", "=", True)],
+            access_rights_uid=name_get_uid,
+        )
+        if isinstance(query, list):
+            # Dominio trivialmente falso: _search ya no devuelve una Query.
+            return query
+        query.add_where(_DOSSIER_PICKER_MATCH, [contains, contains, contains])
+        query.order = None
+        candidates_sql, candidates_params = query.select('"documents_folder".id')
+        self.env.cr.execute(
+            _DOSSIER_PICKER_QUERY.format(candidates=candidates_sql, limit="LIMIT %s" if limit else ""),
+            list(candidates_params) + [term, escaped + "%"] + ([limit] if limit else []),
+        )
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    def name_get(self):
+        if not self.env.context.get("sid_dossier_picker"):
+            return super().name_get()
+        return [
+            (folder.id, self._sid_picker_label(folder) if folder.is_dossier_folder else folder.name)
+            for folder in self
+        ]
+
+    @api.model
+    def _sid_picker_label(self, folder):
+        if folder.dossier_archived:
+            return _("%s (%s, archivado)") % (folder.name, folder.dossier_year)
+        return "%s (%s)" % (folder.name, folder.dossier_year)
+
+    def _auto_init(self):
+        # Columnas nuevas en una BD con carpetas: se rellenan por SQL en vez de
+        # recalcular carpeta a carpeta.
+        cr = self.env.cr
+        fill = False
+        for column, column_type in (
+            ("is_dossier_folder", "bool"),
+            ("dossier_year", "int4"),
+            ("normalized_name", "varchar"),
+            ("dossier_archived", "bool"),
+        ):
+            if not tools.column_exists(cr, self._table, column):
+                tools.create_column(cr, self._table, column, column_type)
+                fill = True
+        res = super()._auto_init()
+        if fill:
+            self._sid_fill_dossier_keys_sql()
+        return res
+
+    def _sid_fill_dossier_keys_sql(self, folder_ids=None):
+        """Recalcula las claves de dossier (is_dossier_folder, dossier_year,
+        normalized_name, dossier_archived) en una pasada SQL.
+
+        Sin `folder_ids` recalcula todas las carpetas; si no, solo las indicadas.
+        """
+        workspace_ids = self._sid_dossier_workspace_ids()
+        archive_id = self._sid_archive_root_id()
+        cr = self.env.cr
+        params = {
+            'workspace_ids': workspace_ids,
+            'archive_id': archive_id or 0,
+            'folder_ids': tuple(folder_ids or ()) or (0,),
+        }
+        where = "f.id IN %(folder_ids)s" if folder_ids is not None else "TRUE"
+        cr.execute("""
+            UPDATE documents_folder f
+               SET is_dossier_folder = FALSE, dossier_year = 0, normalized_name = NULL, dossier_archived = FALSE
+             WHERE (f.is_dossier_folder OR f.dossier_archived) AND {where}
+        """.format(where=where), params)
+        if workspace_ids:
+            cr.execute("""
+                UPDATE documents_folder f
+                   SET is_dossier_folder = TRUE,
+                       dossier_year = btrim(y.name)::int,
+                       normalized_name = lower(regexp_replace(btrim(f.name), '\\s+', ' ', 'g')),
+                       dossier_archived = (y.parent_folder_id = %(archive_id)s)
+                  FROM documents_folder y
+                 WHERE y.id = f.parent_folder_id
+                   AND y.parent_folder_id IN %(workspace_ids)s
+                   AND btrim(y.name) ~ '^[0-9]+$'
+                   AND {where}
+            """.format(where=where), params)
+        self.invalidate_cache(["is_dossier_folder", "dossier_year", "normalized_name", "dossier_archived"])
+
+    # ---------------------------------------------------------------------
+    # Resolución cacheada de root y carpetas de año
+    # ---------------------------------------------------------------------
+
+    @api.model
+    @tools.ormcache("company_id")
+    def _sid_quality_root_id(self, company_id):
+        """Id de la carpeta root de dossieres de calidad (o False).
+
+        Orden: XML-ID canónico, XML-ID heredado y, por último, búsqueda por nombre.
+        Cacheado por base de datos (registry) y compañía; se invalida al cambiar
+        los XML-ID del módulo o las carpetas de primer/segundo nivel.
+        """
+        IMD = self.env["ir.model.data"].sudo()
+        for xmlid in QUALITY_ROOT_XMLIDS:
+            res_model, res_id = IMD._xmlid_to_res_model_res_id(xmlid)
+            if res_model == "documents.folder" and res_id and self.sudo().browse(res_id).exists():
+                return res_id
+        return self.sudo().search([
+            ("name", "=", QUALITY_ROOT_NAME),
+            ("parent_folder_id", "=", False),
+            ("company_id", "in", [False, company_id]),
+        ], limit=1).id
+
+    @api.model
+    @tools.ormcache("root_id")
+    def _sid_year_folder_ids(self, root_id):
+        """{nombre de año: id} de las carpetas de año bajo el root (una consulta)."""
+        self.flush(["parent_folder_id", "name"])
+        self.env.cr.execute(
+            "SELECT id, name FROM documents_folder WHERE parent_folder_id = %s ORDER BY sequence, id",
+            (root_id,),
+        )
+        years = {}
+        for folder_id, name in self.env.cr.fetchall():
+            name = (name or "").strip()
+            if name.isdigit():
+                years.setdefault(name, folder_id)
+        return years
+
+    @api.model
+    def _sid_archive_root_id(self):
+        """Id del workspace "Archivado" (o False); la búsqueda de XML-ID ya está cacheada."""
+        return self.env["ir.model.data"].sudo()._xmlid_to_res_id(ARCHIVED_WORKSPACE_XMLID, raise_if_not_found=False)
+
+    @api.model
+    @tools.ormcache()
+    def _sid_dossier_workspace_ids(self):
+        """Workspaces con dossieres en año/dossier: el root de calidad de cada compañía y "Archivado".
+
+        No depende de la compañía del entorno: los campos almacenados que se
+        calculan a partir de ellos valen lo mismo los recalcule quien los recalcule.
+        """
+        self.flush(["parent_folder_id", "name", "company_id"])
+        self.env.cr.execute(
+            "SELECT DISTINCT company_id FROM documents_folder WHERE parent_folder_id IS NULL AND name = %s",
+            (QUALITY_ROOT_NAME,),
+        )
+        company_ids = {company_id or False for company_id, in self.env.cr.fetchall()} | {False}
+        workspace_ids = {self._sid_quality_root_id(company_id) for company_id in company_ids}
+        workspace_ids.add(self._sid_archive_root_id())
+        return tuple(sorted(workspace_id for workspace_id in workspace_ids if workspace_id))
+
+    @api.model
+    def _sid_quality_root(self):
+        """Root de dossieres de calidad en el entorno actual (vacío si no existe)."""
+        return self.browse(self._sid_quality_root_id(self.env.company.id))
+
+    @api.model
+    def _sid_year_folder(self, year):
+        """Carpeta de año existente bajo el root (vacía si no existe)."""
+        root_id = self._sid_quality_root_id(self.env.company.id)
+        if not root_id:
+            return self.browse()
+        return self.browse(self._sid_year_folder_ids(root_id).get(str(year), False))
+
+    # ---------------------------------------------------------------------
+    # Creación concurrente de carpetas de año y de dossier
+    # ---------------------------------------------------------------------
+
+    def _sid_lock_children(self):
+        """Serializa la creación de hijas bajo estas carpetas (root o año).
+
+        UPDATE sin cambios de la fila padre: una segunda transacción que cree
+        bajo el mismo padre espera al bloqueo de fila y, si la primera confirma,
+        falla con un error de serialización. Con REPEATABLE READ esa transacción
+        no puede ver la carpeta creada, así que solo se resuelve repitiendo en
+        una transacción nueva: Odoo lo hace en las peticiones RPC/HTTP, y los
+        crons lo detectan con `is_concurrent_create_error` y lo dejan para la
+        siguiente transacción. Un bloqueo consultivo no basta: la segunda
+        transacción seguiría sin ver la carpeta tras esperar.
+        """
+        if self.ids:
+            self.env.cr.execute(
+                "UPDATE documents_folder SET write_date = write_date WHERE id IN %s",
+                (tuple(self.ids),),
+            )
+
+    @api.model
+    def _sid_get_or_create_child(self, parent, name, **extra_vals):
+        """Busca/crea la carpeta hija `name` de `parent` sin duplicados concurrentes.
+
+        Un conflicto concurrente (ver `_sid_lock_children`) se propaga tras
+        deshacer el savepoint, con la transacción aún utilizable para que el
+        llamador lo registre y reintente.
+        """
+        Folder = self.sudo()
+        with self.env.cr.savepoint():
+            parent._sid_lock_children()
+            child = Folder.search([('parent_folder_id', '=', parent.id), ('name', '=', name)], limit=1)
+            if not child:
+                vals = {'name': name, 'parent_folder_id': parent.id}
+                vals.update(extra_vals)
+                child = Folder.create(vals)
+        return child
+
+    @api.model
+    def _cron_ensure_year_folders(self):
+        """Crea por adelantado la carpeta del año actual y la de los siguientes."""
+        root = self._sid_quality_root()
+        if not root:
+            return
+        this_year = date.today().year
+        for year in range(this_year, this_year + YEAR_FOLDERS_AHEAD + 1):
+            if self._sid_year_folder(year):
+                continue
+            try:
+                self._sid_get_or_create_child(root, str(year), sequence=year)
+            except psycopg2.Error as e:
+                if not is_concurrent_create_error(e):
+                    raise
+                # La ha creado otra transacción a la vez: ya existe.
+                _logger.info("Year folder %s created concurrently under root %s", year, root.id)
+
+    def _sid_ensure_dossier_unique_index(self):
+        """Índice único (padre, nombre) de las carpetas de año y de dossier del root.
+
+        Si la base ya contiene duplicados no se crea (se avisa en el log); el
+        bloqueo de `_sid_lock_children` sigue evitando duplicados nuevos.
+
+        Se llama desde init(), que en actualizaciones lo crea o lo adapta al
+        root actual. En una instalación nueva init() se ejecuta antes de cargar
+        el XML del root y no hace nada; lo crea el post_init_hook.
+        """
+        cr = self.env.cr
+        root_id = self._sid_quality_root_id(self.env.company.id)
+        cr.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", (DOSSIER_UNIQUE_INDEX,))
+        row = cr.fetchone()
+        expected = "'^%s/([0-9]+/)?[0-9]+/$'" % root_id
+        if row and root_id and expected in row[0]:
+            return
+        if row:
+            cr.execute("DROP INDEX IF EXISTS %s" % DOSSIER_UNIQUE_INDEX)
+        if not root_id:
+            return
+        self.flush(['parent_folder_id', 'name'])
+        try:
+            with cr.savepoint(flush=False):
+                cr.execute(
+                    "CREATE UNIQUE INDEX {name} ON documents_folder (parent_folder_id, name) "
+                    "WHERE parent_path ~ {expected}".format(name=DOSSIER_UNIQUE_INDEX, expected=expected)
+                )
+        except psycopg2.IntegrityError:
+            _logger.warning(
+                "Duplicate year/dossier folder names under root %s: unique index %s not created",
+                root_id, DOSSIER_UNIQUE_INDEX,
+            )
+
+    def _sid_keep_legacy_year_records(self):
+        """Las carpetas de año ya no se definen en XML: evita que la actualización las borre."""
+        self.env.cr.execute("""
+            UPDATE ir_model_data SET noupdate = TRUE
+             WHERE module = 'sid_projects_dossier'
+               AND model = 'documents.folder'
+               AND name LIKE 'sid\\_folder\\_%'
+               AND noupdate IS NOT TRUE
+        """)
+
+    def _sid_touches_root_cache(self):
+        """True si alguna carpeta es root, un workspace de dossieres o una carpeta de año."""
+        workspace_ids = set(self._sid_dossier_workspace_ids())
+        return any(
+            not folder.parent_folder_id
+            or folder.id in workspace_ids
+            or folder.parent_folder_id.id in workspace_ids
+            for folder in self
+        )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        # Crear carpetas de dossier/sección (lo habitual) no invalida nada.
+        if records._sid_touches_root_cache():
+            self.clear_caches()
+        return records
+
+    def unlink(self):
+        touched = self._sid_touches_root_cache()
+        res = super().unlink()
+        if touched:
+            self.clear_caches()
+        return res
+
     @api.model
     def _sid_find_quality_dossiers_root(self):
         """Find the existing root workspace folder.
@@ -55,6 +504,48 @@ class DocumentsFolder(models.Model):
                 }
             )
 
+    def _sid_stat_dossier_ids(self, moving=False):
+        """Ids de dossier cuyas estadísticas dependen de estas carpetas.
+
+        Devuelve None si mover alguna carpeta (root/año) afecta a todos los dossieres.
+        """
+        workspace_segments = {str(workspace_id) for workspace_id in self._sid_dossier_workspace_ids()}
+        dossier_ids = set()
+        for folder in self:
+            segments = (folder.parent_path or '').split('/')[:-1]
+            if not segments or segments[0] not in workspace_segments:
+                continue
+            if len(segments) >= 3:
+                dossier_ids.add(int(segments[2]))
+            elif moving:
+                return None
+        return dossier_ids
+
+    def write(self, vals):
+        moving = 'parent_folder_id' in vals
+        if not moving and 'name' not in vals:
+            res = super().write(vals)
+            # La compañía de un root decide de qué compañía es root de calidad.
+            if 'company_id' in vals and self._sid_touches_root_cache():
+                self.clear_caches()
+            return res
+        touched = self._sid_touches_root_cache()
+        # Mover o renombrar carpetas cambia la clave (sección/estado) de sus documentos.
+        before = self._sid_stat_dossier_ids(moving)
+        res = super().write(vals)
+        if touched or self._sid_touches_root_cache():
+            self.clear_caches()
+        self.flush(['parent_folder_id', 'name'])
+        after = self._sid_stat_dossier_ids(moving)
+        Stat = self.env['sid.dossier.stat'].sudo()
+        if before is None or after is None:
+            Stat._sid_rebuild()
+        elif before | after:
+            Stat._sid_rebuild(before | after)
+        return res
+
     def init(self):
         # Called at registry init (install & upgrade). Must be idempotent.
         self._sid_ensure_quality_dossiers_root_xmlid()
+        self._sid_keep_legacy_year_records()
+        self._sid_ensure_dossier_unique_index()
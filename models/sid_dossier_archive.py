@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+"""Archivado masivo de dossieres aprobados en el workspace "Archivado".
+
+Archivar mueve el subárbol completo de cada dossier de root/año/dossier a
+Archivado/año/dossier. Las carpetas conservan su id, de modo que los vínculos
+de sale.quotations/sale.order siguen siendo válidos, y "Archivado" cuenta como
+workspace de dossieres: los documentos mantienen su dossier, las estadísticas
+se conservan y el dossier sigue apareciendo al buscar duplicados (marcado con
+`dossier_archived`). El `parent_path` de todo el subárbol se reescribe con un
+único UPDATE por lote, en lugar de un write() por carpeta (que recalcularía
+documento a documento). Restaurar hace el camino inverso hacia la carpeta del
+mismo año bajo el root de calidad.
+"""
+
+import logging
+import time
+
+import psycopg2
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from .documents_folder_xmlid import ARCHIVED_WORKSPACE_XMLID, is_concurrent_create_error
+
+_logger = logging.getLogger(__name__)
+
+# Días sin actividad tras los que un dossier aprobado se archiva (<= 0 desactiva el cron).
+ARCHIVE_AGE_PARAM = 'sid_projects_dossier.archive_after_days'
+ARCHIVE_AGE_DEFAULT = 365
+ARCHIVE_BATCH_SIZE = 50
+# Tiempo máximo por ejecución del cron antes de re-programarse (segundos).
+ARCHIVE_TIME_BUDGET = 240
+
+# Dossieres con todos sus contratos aprobados y sin cambios en documentos desde %(cutoff)s.
+_ARCHIVABLE_QUERY = """
+    SELECT f.id
+      FROM documents_folder f
+     WHERE f.is_dossier_folder
+       AND NOT f.dossier_archived
+       AND f.create_date < %(cutoff)s
+       AND EXISTS (SELECT 1 FROM sale_quotations q
+                    WHERE q.dossier_effective_folder_id = f.id
+                      AND q.dossier_state = 'aprobado')
+       AND NOT EXISTS (SELECT 1 FROM sale_quotations q
+                        WHERE q.dossier_effective_folder_id = f.id
+                          AND q.dossier_state IS DISTINCT FROM 'aprobado')
+       AND NOT EXISTS (SELECT 1 FROM documents_document d
+                        WHERE d.dossier_folder_id = f.id
+                          AND d.write_date >= %(cutoff)s)
+     ORDER BY f.dossier_year, f.id
+     LIMIT %(limit)s
+"""
+
+
+class SidDossierArchive(models.AbstractModel):
+    _name = 'sid.dossier.archive'
+    _description = 'Archivado de dossieres'
+
+    @api.model
+    def _sid_archived_workspace(self):
+        workspace = self.env.ref(ARCHIVED_WORKSPACE_XMLID, raise_if_not_found=False)
+        if not workspace:
+            raise UserError(_('No se encuentra el workspace "Archivado".'))
+        return workspace.sudo()
+
+    # ---------------------------------------------------------------------
+    # Movimiento de subárboles
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_move_dossiers(self, moves):
+        """Mueve cada dossier (con su subárbol) bajo su nuevo padre: [(dossier, padre)].
+
+        Devuelve los ids de todas las carpetas movidas.
+        """
+        Folder = self.env['documents.folder'].sudo()
+        Folder.flush(['parent_folder_id', 'name'])
+        cr = self.env.cr
+        dossier_ids = [dossier.id for dossier, _parent in moves]
+        parent_ids = [parent.id for _dossier, parent in moves]
+        cr.execute(
+            "SELECT id, parent_path FROM documents_folder WHERE id IN %s",
+            (tuple(set(dossier_ids + parent_ids)),),
+        )
+        paths = dict(cr.fetchall())
+        rows = [
+            (dossier_id, parent_id, paths[dossier_id], '%s%s/' % (paths[parent_id], dossier_id))
+            for dossier_id, parent_id in zip(dossier_ids, parent_ids)
+        ]
+        values = ', '.join(cr.mogrify('(%s, %s, %s, %s)', row).decode() for row in rows)
+        cr.execute("""
+            UPDATE documents_folder f
+               SET parent_folder_id = m.parent_id,
+                   write_uid = %s,
+                   write_date = (now() AT TIME ZONE 'UTC')
+              FROM (VALUES {values}) AS m(id, parent_id, old_prefix, new_prefix)
+             WHERE f.id = m.id
+        """.format(values=values), (self.env.uid,))
+        # [prefijo, prefijo || '~') equivale a "empieza por prefijo" (parent_path
+        # solo tiene dígitos y '/', anteriores a '~') y, con los operadores
+        # ~>=~/~<~, usa sid_documents_folder_parent_path_idx (text_pattern_ops).
+        cr.execute("""
+            UPDATE documents_folder f
+               SET parent_path = m.new_prefix || substr(f.parent_path, length(m.old_prefix) + 1)
+              FROM (VALUES {values}) AS m(id, parent_id, old_prefix, new_prefix)
+             WHERE f.parent_path ~>=~ m.old_prefix
+               AND f.parent_path ~<~ m.old_prefix || '~'
+         RETURNING f.id
+        """.format(values=values))
+        folder_ids = [row[0] for row in cr.fetchall()]
+        Folder.invalidate_cache()
+
+        # Solo cambia dossier_archived: el dossier, la sección y el estado de cada
+        # documento son los mismos bajo el root de calidad y bajo "Archivado", así
+        # que dossier_folder_id y las estadísticas no varían.
+        Folder._sid_fill_dossier_keys_sql(dossier_ids)
+        return folder_ids
+
+    # ---------------------------------------------------------------------
+    # Archivar / restaurar
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_archive_dossiers(self, dossiers):
+        """Mueve los dossieres a Archivado/año; devuelve los archivados."""
+        dossiers = dossiers.sudo().filtered(lambda folder: folder.is_dossier_folder and not folder.dossier_archived)
+        if not dossiers:
+            return dossiers
+        workspace = self._sid_archived_workspace()
+        Folder = self.env['documents.folder'].sudo()
+        targets = {}
+        moves = []
+        for dossier in dossiers:
+            year = dossier.dossier_year
+            if year not in targets:
+                targets[year] = Folder._sid_get_or_create_child(workspace, str(year), sequence=year)
+            moves.append((dossier, targets[year]))
+        self._sid_move_dossiers(moves)
+        _logger.info('Archived %s dossier(s): %s', len(dossiers), dossiers.ids)
+        return dossiers
+
+    @api.model
+    def _sid_restore_dossiers(self, dossiers):
+        """Devuelve dossieres archivados a root/año; devuelve los restaurados."""
+        dossiers = dossiers.sudo().filtered('dossier_archived')
+        if not dossiers:
+            return dossiers
+        Folder = self.env['documents.folder'].sudo()
+        root = Folder._sid_quality_root()
+        if not root:
+            raise UserError(_('No se encuentra la carpeta root de dossieres de calidad.'))
+
+        targets = {}
+        moves = []
+        for dossier in dossiers:
+            year = dossier.parent_folder_id.name.strip()
+            if year not in targets:
+                targets[year] = Folder._sid_year_folder(year) or Folder._sid_get_or_create_child(
+                    root, year, sequence=int(year),
+                )
+            moves.append((dossier, targets[year]))
+
+        # El índice único (año, nombre) rechazaría el movimiento: se avisa antes.
+        existing = Folder.search([
+            ('parent_folder_id', 'in', [target.id for target in targets.values()]),
+            ('name', 'in', dossiers.mapped('name')),
+        ])
+        taken = {(folder.parent_folder_id.id, folder.name) for folder in existing}
+        clashes = [dossier.name for dossier, target in moves if (target.id, dossier.name) in taken]
+        if clashes:
+            raise UserError(_(
+                'Ya existe un dossier con el mismo nombre en su año; renómbrelo antes de restaurar:\n%s'
+            ) % '\n'.join(clashes))
+
+        self._sid_move_dossiers(moves)
+        _logger.info('Restored %s dossier(s): %s', len(dossiers), dossiers.ids)
+        return dossiers
+
+    # ---------------------------------------------------------------------
+    # Selección y cron
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_archive_age_days(self):
+        value = self.env['ir.config_parameter'].sudo().get_param(ARCHIVE_AGE_PARAM, ARCHIVE_AGE_DEFAULT)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            _logger.warning('Invalid %s value %r, using %s', ARCHIVE_AGE_PARAM, value, ARCHIVE_AGE_DEFAULT)
+            return ARCHIVE_AGE_DEFAULT
+
+    @api.model
+    def _sid_archivable_dossier_ids(self, age_days=None, limit=ARCHIVE_BATCH_SIZE):
+        """Ids de dossieres aprobados sin actividad desde hace `age_days` días."""
+        age_days = self._sid_archive_age_days() if age_days is None else age_days
+        if age_days <= 0:
+            return []
+        self.env['sale.quotations'].flush(['dossier_state', 'dossier_effective_folder_id'])
+        self.env['documents.folder'].flush(['is_dossier_folder', 'dossier_archived', 'dossier_year'])
+        self.env['documents.document'].flush(['dossier_folder_id'])
+        cutoff = fields.Datetime.subtract(fields.Datetime.now(), days=age_days)
+        self.env.cr.execute(_ARCHIVABLE_QUERY, {'cutoff': cutoff, 'limit': limit})
+        return [row[0] for row in self.env.cr.fetchall()]
+
+    @api.model
+    def _sid_reschedule_cron(self):
+        cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_archive', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    @api.model
+    def _cron_archive_dossiers(self, batch_size=ARCHIVE_BATCH_SIZE, auto_commit=True):
+        """Archiva por lotes los dossieres elegibles, con commit por lote."""
+        Folder = self.env['documents.folder'].sudo()
+        started = time.monotonic()
+        while True:
+            dossier_ids = self._sid_archivable_dossier_ids(limit=batch_size)
+            if not dossier_ids:
+                return
+            try:
+                self._sid_archive_dossiers(Folder.browse(dossier_ids))
+            except psycopg2.Error as e:
+                if not is_concurrent_create_error(e):
+                    raise
+                # Otra transacción creó a la vez la carpeta de año en "Archivado"
+                # (antes de mover nada): el lote se repite en una ejecución nueva.
+                _logger.info('Dossier archival deferred: concurrent year folder creation')
+                self._sid_reschedule_cron()
+                return
+            if auto_commit:
+                self.env.cr.commit()
+
+            if time.monotonic() - started > ARCHIVE_TIME_BUDGET:
+                self._sid_reschedule_cron()
+                return
+
+    # ---------------------------------------------------------------------
+    # Acciones manuales (desde contratos)
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_notify(self, title, message):
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': title,
+                'message': message,
+                'type': 'success',
+                'sticky': False,
+            },
+        }
+
+    @api.model
+    def _sid_archive_quotation_dossiers(self, quotations):
+        """Archiva los dossieres de los contratos dados, sin esperar al plazo del cron."""
+        dossiers = quotations.sudo().mapped('dossier_effective_folder_id').filtered(
+            lambda folder: folder.is_dossier_folder and not folder.dossier_archived
+        )
+        if not dossiers:
+            raise UserError(_('Los contratos seleccionados no tienen un dossier activo que archivar.'))
+        pending = self.env['sale.quotations'].sudo().search([
+            ('dossier_effective_folder_id', 'in', dossiers.ids),
+            ('dossier_state', '!=', 'aprobado'),
+        ])
+        if pending:
+            raise UserError(_(
+                'Solo se archivan dossieres con todos sus contratos aprobados. Pendientes:\n%s'
+            ) % '\n'.join(pending.mapped('display_name')))
+        archived = self._sid_archive_dossiers(dossiers)
+        return self._sid_notify(_('Archivar dossieres'), _('%s dossier(es) archivado(s).') % len(archived))
+
+    @api.model
+    def _sid_restore_quotation_dossiers(self, quotations):
+        """Restaura los dossieres archivados de los contratos dados."""
+        restored = self._sid_restore_dossiers(quotations.sudo().mapped('dossier_effective_folder_id'))
+        if not restored:
+            raise UserError(_('Los contratos seleccionados no tienen dossieres archivados.'))
+        return self._sid_notify(_('Restaurar dossieres'), _('%s dossier(es) restaurado(s).') % len(restored))
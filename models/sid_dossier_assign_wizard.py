@@ -2,12 +2,18 @@
 
 from datetime import date
 
+from markupsafe import Markup
+
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError
+from odoo.tools import str2bool
 
+from .documents_folder_xmlid import normalize_folder_name
 # Reutilizamos la lógica histórica de creación de estructura de dossier
 from .sid_projects_dossier_server_actions import create_dossier_structure
 
+ASYNC_PROVISIONING_PARAM = 'sid_projects_dossier.async_provisioning'
+
 
 class SidDossierAssignWizard(models.TransientModel):
     _name = 'sid.dossier.assign.wizard'
@@ -60,7 +66,9 @@ class SidDossierAssignWizard(models.TransientModel):
     existing_folder_id = fields.Many2one(
         'documents.folder',
         string='Dossier existente (nivel 2)',
-        domain=[],
+        # Dossieres (root/año/dossier) de todos los años; la vista busca con
+        # el contexto sid_dossier_picker (búsqueda indexada y año en el nombre).
+        domain=[('is_dossier_folder', '=', True)],
     )
 
     new_folder_name = fields.Char(string='Nombre del dossier', readonly=True)
@@ -72,66 +80,95 @@ class SidDossierAssignWizard(models.TransientModel):
     # ---------------------------------------------------------------------
 
     def _get_root_folder(self):
-        # XML-ID canónico gestionado por hooks/datos del módulo.
-        root = self.env.ref('sid_projects_dossier.sid_workspace_quality_dossiers', raise_if_not_found=False)
-        if root:
-            return root
-
-        # Retrocompatibilidad: instalaciones antiguas pudieron usar este XML-ID.
-        legacy_root = self.env.ref('sid_projects_dossier.folder_root_dossieres_calidad', raise_if_not_found=False)
-        if legacy_root:
-            return legacy_root
-
-        # Fallback by name
-        return self.env['documents.folder'].sudo().search([
-            ('name', '=', 'Dossieres de calidad'),
-            ('parent_folder_id', '=', False)
-        ], limit=1)
+        # XML-ID canónico, XML-ID heredado o nombre; resuelto una vez por compañía (ormcache).
+        return self.env['documents.folder']._sid_quality_root()
 
     def _ensure_year_folder(self, year_int: int):
+        Folder = self.env['documents.folder'].sudo()
+        year_folder = Folder._sid_year_folder(year_int)
+        if year_folder:
+            return year_folder
+        # Normalmente ya existe (cron de carpetas de año); si no, se crea bajo bloqueo.
         root = self._get_root_folder()
         if not root:
             raise UserError(_('No se ha encontrado el root "Dossieres de calidad" en Documentos.'))
-        Folder = self.env['documents.folder'].sudo()
-        yname = str(year_int)
-        year_folder = Folder.search([('parent_folder_id', '=', root.id), ('name', '=', yname)], limit=1)
-        if not year_folder:
-            year_folder = Folder.create({'name': yname, 'parent_folder_id': root.id})
-        return year_folder
-
-    def _folder_has_documents(self, folder):
-        Doc = self.env['documents.document'].sudo()
-        return bool(Doc.search_count([('folder_id', '=', folder.id)]))
-
-    def _folder_linked_to_other_contract(self, folder, root_quotation):
-        Q = self.env['sale.quotations'].sudo()
-        other = Q.search([
-            ('dossier_folder_id', '=', folder.id),
-            ('id', '!=', root_quotation.id),
-        ], limit=1)
-        return other
-
-    def _sync_related_sale_orders(self, quotations):
-        """Fuerza recálculo inmediato en sale.order sin asumir nombre de campo inverso en quotations."""
-        quotations = quotations.exists()
-        SaleOrder = self.env['sale.order'].sudo()
-        sale_orders = self.sale_order_id.exists()
-
-        if quotations:
-            # Distintas instalaciones pueden exponer relaciones diferentes en sale.quotations.
-            for fname in ('sale_order_id', 'order_id', 'sale_id'):
-                if fname in quotations._fields:
-                    sale_orders |= quotations.mapped(fname).exists()
-
-            # Fallback robusto: resolver desde sale.order -> quotations_id (módulo actual).
-            if 'quotations_id' in SaleOrder._fields:
-                sale_orders |= SaleOrder.search([('quotations_id', 'in', quotations.ids)])
-
-        if not sale_orders:
+        return Folder._sid_get_or_create_child(root, str(year_int), sequence=year_int)
+
+    def _sid_async_provisioning(self):
+        """Estructura en segundo plano: parámetro de sistema, salvo que ya estemos en la cola."""
+        if self.env.context.get('sid_sync_provisioning'):
+            return False
+        return str2bool(self.env['ir.config_parameter'].sudo().get_param(ASYNC_PROVISIONING_PARAM, 'False'), False)
+
+    def _sid_provision_structure(self, quotation, dossier_folder, template, profiler, errors):
+        """Crea la estructura ahora o la deja pendiente para el cron de aprovisionamiento.
+
+        Un dossier archivado que vuelve a usarse se restaura antes a su carpeta de año.
+        """
+        if dossier_folder.dossier_archived:
+            with profiler.step('restore_archived_dossier'):
+                self.env['sid.dossier.archive']._sid_restore_dossiers(dossier_folder)
+        if self._sid_async_provisioning():
+            with profiler.step('schedule_provisioning'):
+                quotation._sid_schedule_dossier_provisioning()
             return
+        create_dossier_structure(self.env, dossier_folder, template=template, profiler=profiler, errors=errors)
+        if quotation.dossier_provisioning_state:
+            quotation.sudo().write({'dossier_provisioning_state': 'done', 'dossier_provisioning_error': False})
+
+    def _get_dossier_template(self, quotation):
+        """Árbol compilado de la plantilla aplicable al cliente del contrato."""
+        partner = self.env['res.partner']
+        if 'partner_id' in quotation._fields:
+            partner = quotation.partner_id
+        if not partner and 'sale_order_id' in quotation._fields:
+            partner = quotation.sale_order_id.partner_id
+        return self.env['sid.dossier.template']._sid_get_compiled_template(partner.commercial_partner_id)
+
+    def _folder_occupancy(self, folder):
+        """Vista previa de ocupación de `folder` en una sola consulta.
+
+        Devuelve {'total': nº documentos del subárbol, 'sections': [(sección, nº)],
+        'quotations': [(id, nombre, vinculada directamente, id del principal)]}.
+        Los documentos en la propia carpeta cuentan con sección False.
+        """
+        self.env['documents.document'].flush(['folder_id', 'active'])
+        self.env['documents.folder'].flush(['parent_folder_id', 'name'])
+        self.env['sale.quotations'].flush(['name', 'dossier_folder_id', 'dossier_effective_folder_id', 'dossier_root_id'])
+        self.env.cr.execute("""
+            WITH top AS (
+                SELECT id, parent_path FROM documents_folder WHERE id = %(folder_id)s
+            ), sections AS (
+                SELECT NULLIF(split_part(substr(f.parent_path, length(top.parent_path) + 1), '/', 1), '')::int AS section_id,
+                       count(*) AS document_count
+                  FROM top
+                  JOIN documents_folder f ON f.parent_path LIKE top.parent_path || '%%'
+                  JOIN documents_document d ON d.folder_id = f.id AND d.active
+                 GROUP BY 1
+            )
+            SELECT 'section', s.section_id, sec.name, s.document_count, NULL, NULL
+              FROM sections s
+              LEFT JOIN documents_folder sec ON sec.id = s.section_id
+            UNION ALL
+            SELECT 'quotation', q.id, q.name, NULL, q.dossier_folder_id = %(folder_id)s, q.dossier_root_id
+              FROM sale_quotations q
+             WHERE q.dossier_folder_id = %(folder_id)s
+                OR q.dossier_effective_folder_id = %(folder_id)s
+        """, {'folder_id': folder.id})
+        occupancy = {'total': 0, 'sections': [], 'quotations': []}
+        for kind, record_id, name, count, own, root_id in self.env.cr.fetchall():
+            if kind == 'section':
+                occupancy['total'] += count
+                occupancy['sections'].append((name if record_id else False, count))
+            else:
+                occupancy['quotations'].append((record_id, name, own, root_id))
+        occupancy['sections'].sort(key=lambda section: section[0] or '')
+        return occupancy
 
-        # Escritura noop para invalidar caché/recompute de campos store en la misma transacción.
-        sale_orders.write({})
+    def _sync_related_sale_orders(self, quotations):
+        """Recalcula ya los campos de dossier de los pedidos del contrato y sus adendas."""
+        quotations |= self.sale_order_id.quotations_id
+        self.env['sale.order']._sid_recompute_dossier_fields(quotations)
 
     # ---------------------------------------------------------------------
     # Onchange / defaults
@@ -263,29 +300,24 @@ class SidDossierAssignWizard(models.TransientModel):
         root_q = (q.dossier_root_id or q) if self.contract_kind != 'adenda' else (self.principal_quotation_id or q.dossier_root_id or q)
 
         msgs = []
-        if self._folder_has_documents(self.existing_folder_id):
-            msgs.append(_('La carpeta seleccionada ya contiene documentos. Se recomienda NO reasignar salvo que sea intencionado.'))
-
-        other = self._folder_linked_to_other_contract(self.existing_folder_id, root_q)
-        if other:
-            msgs.append(_('La carpeta ya está vinculada al contrato: %s') % (other.display_name or other.name))
+        occupancy = self._folder_occupancy(self.existing_folder_id)
+        if occupancy['total']:
+            msgs.append(_('La carpeta seleccionada ya contiene %s documentos. Se recomienda NO reasignar salvo que sea intencionado.') % occupancy['total'])
+            msgs.extend(
+                '  - %s: %s' % (section or _('(sin sección)'), count)
+                for section, count in occupancy['sections']
+            )
+
+        # Vinculadas a otro contrato: distintas del principal y de sus adendas que solo heredan su dossier.
+        others = [
+            name for quotation_id, name, own, root_id in occupancy['quotations']
+            if quotation_id != root_q.id and (own or root_id != root_q.id)
+        ]
+        if others:
+            msgs.append(_('La carpeta ya está vinculada al contrato: %s') % ', '.join(others))
 
         self.warning_message = '\n'.join(msgs) if msgs else False
 
-    # Dynamic domain for existing_folder_id (nivel 2 de todos los años)
-    @api.onchange('quotation_id')
-    def _onchange_existing_folder_domain(self):
-        root = self._get_root_folder()
-        if root:
-            return {
-                'domain': {
-                    'existing_folder_id': [('parent_folder_id.parent_folder_id', '=', root.id)],
-                }
-            }
-        return {
-            'domain': {'existing_folder_id': []}
-        }
-
     # ---------------------------------------------------------------------
     # Confirm
     # ---------------------------------------------------------------------
@@ -319,43 +351,40 @@ class SidDossierAssignWizard(models.TransientModel):
             target_q = self.quotation_id
 
         Folder = self.env['documents.folder'].sudo()
+        profiler = self.env['sid.dossier.perf.log']._sid_profiler('action_confirm', target_q)
+        with profiler.step('template'):
+            template = self._get_dossier_template(target_q)
+        structure_errors = []
 
         def _find_existing_dossier_any_year(name):
-            """Busca un dossier por nombre bajo cualquier año (evita duplicar 2025/2026)."""
-            name = (name or '').strip()
-            if not name:
-                return Folder
-
-            root = self._get_root_folder()
-            # Carpeta de año: hija directa del root
-            candidates = Folder.search([
-                ('parent_folder_id.parent_folder_id', '=', root.id),
-                ('name', '=', name),
-            ])
-            if not candidates:
+            """Busca un dossier por nombre normalizado bajo cualquier año (evita duplicar 2025/2026).
+
+            Una única búsqueda indexada; preferimos el año más antiguo
+            (p.ej. si existe en 2025 no crear en 2026). Incluye los dossieres
+            archivados, que se restauran al reutilizarlos.
+            """
+            normalized = normalize_folder_name(name)
+            if not normalized:
                 return Folder
-
-            # Preferimos el año más antiguo (p.ej. si existe en 2025 no crear en 2026)
-            def _year_of(f):
-                try:
-                    return int((f.parent_folder_id.name or '9999').strip())
-                except Exception:
-                    return 9999
-            return candidates.sorted(key=_year_of)[:1]
+            return Folder.search([
+                ('is_dossier_folder', '=', True),
+                ('normalized_name', '=', normalized),
+            ], order='dossier_year, id', limit=1)
 
         if self.mode == 'existing':
             # Vincular una carpeta ya existente (puede pertenecer a cualquier año)
             if not self.existing_folder_id:
                 raise UserError(_('Seleccione una carpeta de dossier existente.'))
             dossier_folder = self.existing_folder_id
-            target_q.sudo().write({'dossier_folder_id': dossier_folder.id})
+            with profiler.step('link_quotation'):
+                target_q.sudo().write({'dossier_folder_id': dossier_folder.id})
 
-            # Si la adenda pasa a usar dossier del principal, limpiar dossier propio previo.
-            if self.contract_kind == 'adenda' and self.addenda_policy == 'use_principal':
-                self.quotation_id.sudo().write({'dossier_folder_id': False})
+                # Si la adenda pasa a usar dossier del principal, limpiar dossier propio previo.
+                if self.contract_kind == 'adenda' and self.addenda_policy == 'use_principal':
+                    self.quotation_id.sudo().write({'dossier_folder_id': False})
 
             # Asegurar estructura mínima (idempotente) sin tocar el año
-            create_dossier_structure(self.env, dossier_folder)
+            self._sid_provision_structure(target_q, dossier_folder, template, profiler, structure_errors)
 
         else:
             # Crear (o reutilizar) el dossier.
@@ -364,9 +393,10 @@ class SidDossierAssignWizard(models.TransientModel):
             # - Si no existe => crear bajo el año actual
             if target_q.dossier_folder_id:
                 dossier_folder = target_q.dossier_folder_id
-                create_dossier_structure(self.env, dossier_folder)
+                self._sid_provision_structure(target_q, dossier_folder, template, profiler, structure_errors)
             else:
-                year_folder = self._ensure_year_folder(date.today().year)
+                with profiler.step('year_folder'):
+                    year_folder = self._ensure_year_folder(date.today().year)
                 dossier_name = (self.new_folder_name or target_q.name or '').strip()
                 if not dossier_name:
                     raise UserError(_('No se pudo determinar el nombre del dossier.'))
@@ -376,7 +406,8 @@ class SidDossierAssignWizard(models.TransientModel):
                 # del principal cuando ambos comparten denominación.
                 force_new_folder = self.contract_kind == 'adenda' and self.addenda_policy == 'own_dossier'
 
-                existing_any_year = _find_existing_dossier_any_year(dossier_name)
+                with profiler.step('find_existing_dossier_any_year'):
+                    existing_any_year = _find_existing_dossier_any_year(dossier_name)
 
                 # (A) Reutilización por nombre (si NO se fuerza creación)
                 dossier_folder = Folder
@@ -392,25 +423,31 @@ class SidDossierAssignWizard(models.TransientModel):
                             'Vincule la carpeta existente o cambie la política de adenda.'
                         ) % (dossier_name, existing_any_year.display_name))
 
-                    dossier_folder = Folder.create({'name': dossier_name, 'parent_folder_id': year_folder.id})
+                    with profiler.step('create_dossier_folder'):
+                        dossier_folder = Folder._sid_get_or_create_child(year_folder, dossier_name)
 
                 # Crear subcarpetas estándar bajo el dossier (contratos, certificados, etc.)
-                create_dossier_structure(self.env, dossier_folder)
+                self._sid_provision_structure(target_q, dossier_folder, template, profiler, structure_errors)
 
-                target_q.sudo().write({'dossier_folder_id': dossier_folder.id})
+                with profiler.step('link_quotation'):
+                    target_q.sudo().write({'dossier_folder_id': dossier_folder.id})
 
-                # Si se eligió reutilizar dossier principal desde una adenda, eliminar vínculo propio.
-                if self.contract_kind == 'adenda' and self.addenda_policy == 'use_principal':
-                    self.quotation_id.sudo().write({'dossier_folder_id': False})
+                    # Si se eligió reutilizar dossier principal desde una adenda, eliminar vínculo propio.
+                    if self.contract_kind == 'adenda' and self.addenda_policy == 'use_principal':
+                        self.quotation_id.sudo().write({'dossier_folder_id': False})
 
         # Refrescar sale.order relacionado para que dossier_folder_id/dossier_asignado se vean al cerrar wizard.
-        self._sync_related_sale_orders(target_q | self.quotation_id)
+        with profiler.step('sync_related_sale_orders'):
+            self._sync_related_sale_orders(target_q | self.quotation_id)
 
         # Optional: chatter note (if mail.thread available)
-        try:
-            msg = _('Dossier asignado: %s') % (target_q.dossier_folder_id.display_name)
-            target_q.message_post(body=msg)
-        except Exception:
-            pass
-
+        with profiler.step('message_post'):
+            try:
+                # Markup.join escapa cada línea: los avisos llevan texto de excepciones.
+                lines = [_('Dossier asignado: %s') % target_q.dossier_folder_id.display_name] + structure_errors
+                target_q.message_post(body=Markup('<br/>').join(lines))
+            except Exception:
+                pass
+
+        profiler.save()
         return {'type': 'ir.actions.client', 'tag': 'reload'}
@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""Plan de índices de las búsquedas críticas del dossier.
+
+Todos los índices compuestos/parciales del módulo se definen aquí y se crean
+(idempotentes) desde `init()`. `_sid_check_query_plans` ejecuta `EXPLAIN` sobre
+cada consulta crítica con `enable_seqscan = off` y señala las que aun así
+recurren a un Seq Scan, es decir, las que no tienen un índice utilizable.
+"""
+
+import json
+import logging
+
+import psycopg2
+
+from odoo import api, models, _
+
+_logger = logging.getLogger(__name__)
+
+# (nombre, tabla, definición)
+SID_INDEXES = [
+    # _folder_occupancy / vínculos dossier <-> contrato
+    ('sid_sale_quotations_dossier_folder_idx', 'sale_quotations',
+     '(dossier_folder_id) WHERE dossier_folder_id IS NOT NULL'),
+    # Familias de contrato (principal + adendas)
+    ('sid_sale_quotations_dossier_root_idx', 'sale_quotations', '(dossier_root_id)'),
+    # Cron de aprovisionamiento diferido: solo trabajos pendientes/en curso
+    ('sid_sale_quotations_provisioning_idx', 'sale_quotations',
+     "(dossier_provisioning_state) WHERE dossier_provisioning_state IN ('pending', 'running')"),
+    # Resolución sale.order <- sale.quotations (_sid_recompute_dossier_fields)
+    ('sid_sale_order_quotations_idx', 'sale_order', '(quotations_id) WHERE quotations_id IS NOT NULL'),
+    # Dominio del menú Dossieres (tiene_dossier AND state = 'sale')
+    ('sid_sale_order_dossier_sale_idx', 'sale_order',
+     "(partner_id, quotations_id) WHERE tiene_dossier AND state = 'sale'"),
+    # Búsqueda de carpeta hija por nombre (estructura del dossier, carpetas de año)
+    ('sid_documents_folder_parent_name_idx', 'documents_folder', '(parent_folder_id, name)'),
+    # Subárbol de una carpeta por prefijo de parent_path (ocupación, estadísticas)
+    ('sid_documents_folder_parent_path_idx', 'documents_folder', '(parent_path text_pattern_ops)'),
+    # Contratos/adendas que usan un dossier (propio o heredado)
+    ('sid_sale_quotations_effective_folder_idx', 'sale_quotations',
+     '(dossier_effective_folder_id) WHERE dossier_effective_folder_id IS NOT NULL'),
+    # Dossier con el mismo nombre normalizado en cualquier año
+    ('sid_documents_folder_dossier_name_idx', 'documents_folder',
+     '(normalized_name, dossier_year) WHERE is_dossier_folder'),
+]
+
+# Índices trigram (requieren pg_trgm) del selector "Dossier existente":
+# búsquedas ILIKE '%término%' por nombre de dossier, contrato y cliente.
+SID_TRIGRAM_INDEXES = [
+    ('sid_documents_folder_dossier_name_trgm_idx', 'documents_folder',
+     'USING gin (normalized_name gin_trgm_ops) WHERE is_dossier_folder'),
+    ('sid_sale_quotations_name_trgm_idx', 'sale_quotations',
+     'USING gin (name gin_trgm_ops) WHERE dossier_folder_id IS NOT NULL'),
+    ('sid_res_partner_name_trgm_idx', 'res_partner', 'USING gin (name gin_trgm_ops)'),
+]
+
+# (descripción, consulta, parámetros, tablas que no deben recorrerse secuencialmente)
+SID_CRITICAL_QUERIES = [
+    (
+        'sale.quotations por dossier_folder_id',
+        "SELECT id FROM sale_quotations WHERE dossier_folder_id = %s AND id != %s LIMIT 1",
+        (0, 0),
+        ('sale_quotations',),
+    ),
+    (
+        'sale.quotations por dossier_root_id',
+        "SELECT id FROM sale_quotations WHERE dossier_root_id = %s",
+        (0,),
+        ('sale_quotations',),
+    ),
+    (
+        'sale.order por quotations_id',
+        "SELECT id FROM sale_order WHERE quotations_id IN %s",
+        ((0,),),
+        ('sale_order',),
+    ),
+    (
+        'Dominio del menú Dossieres',
+        "SELECT id FROM sale_order WHERE tiene_dossier AND state = 'sale' ORDER BY partner_id LIMIT 80",
+        (),
+        ('sale_order',),
+    ),
+    (
+        'documents.folder hija por (padre, nombre)',
+        "SELECT id FROM documents_folder WHERE parent_folder_id = %s AND name = %s LIMIT 1",
+        (0, ''),
+        ('documents_folder',),
+    ),
+    (
+        'documents.folder subárbol por parent_path',
+        "SELECT id FROM documents_folder WHERE parent_path LIKE %s",
+        ('0/%',),
+        ('documents_folder',),
+    ),
+    (
+        'sale.quotations por dossier_effective_folder_id',
+        "SELECT id FROM sale_quotations WHERE dossier_effective_folder_id = %s",
+        (0,),
+        ('sale_quotations',),
+    ),
+    (
+        'documents.folder dossier por nombre normalizado (cualquier año)',
+        "SELECT id FROM documents_folder WHERE is_dossier_folder AND normalized_name = %s "
+        "ORDER BY dossier_year, id LIMIT 1",
+        ('',),
+        ('documents_folder',),
+    ),
+    (
+        'documents.folder subárbol por rango de parent_path (archivado)',
+        "SELECT id FROM documents_folder WHERE parent_path ~>=~ %s AND parent_path ~<~ %s",
+        ('0/', '0/~'),
+        ('documents_folder',),
+    ),
+    (
+        'documents.document por dossier_folder_id (archivado)',
+        "SELECT 1 FROM documents_document WHERE dossier_folder_id = %s AND write_date >= now() LIMIT 1",
+        (0,),
+        ('documents_document',),
+    ),
+]
+
+
+def _seq_scanned_relations(plan):
+    """Relaciones recorridas con Seq Scan en un plan EXPLAIN (FORMAT JSON)."""
+    relations = set()
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if node.get('Node Type') == 'Seq Scan':
+            relations.add(node.get('Relation Name'))
+        nodes.extend(node.get('Plans', []))
+    return relations
+
+
+class SidDossierIndexPlan(models.AbstractModel):
+    _name = 'sid.dossier.index.plan'
+    _description = 'Plan de índices del dossier'
+
+    def init(self):
+        # Se registra el último: todas las tablas/columnas ya existen.
+        indexes = list(SID_INDEXES)
+        if self._sid_trigram_available():
+            indexes += SID_TRIGRAM_INDEXES
+        for name, table, definition in indexes:
+            self.env.cr.execute(
+                "CREATE INDEX IF NOT EXISTS {name} ON {table} {definition}".format(
+                    name=name, table=table, definition=definition,
+                )
+            )
+
+    @api.model
+    def _sid_trigram_available(self):
+        """True si pg_trgm está (o se ha podido) instalar en la base de datos."""
+        cr = self.env.cr
+        cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        if cr.fetchone():
+            return True
+        try:
+            with cr.savepoint(flush=False):
+                cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except psycopg2.Error:
+            _logger.warning("pg_trgm not available: dossier picker searches will not use trigram indexes")
+            return False
+        return True
+
+    @api.model
+    def _sid_check_query_plans(self):
+        """EXPLAIN de las consultas críticas; devuelve [(descripción, tablas con Seq Scan)]."""
+        cr = self.env.cr
+        failures = []
+        # SET LOCAL dentro de un savepoint: si un EXPLAIN falla, el rollback al
+        # savepoint restaura el parámetro y el error original se propaga.
+        with cr.savepoint(flush=False):
+            cr.execute("SET LOCAL enable_seqscan = off")
+            for description, query, params, tables in SID_CRITICAL_QUERIES:
+                cr.execute("EXPLAIN (FORMAT JSON) " + query, params)
+                plan = cr.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scanned = _seq_scanned_relations(plan[0]['Plan']) & set(tables)
+                if scanned:
+                    _logger.warning('Query plan regression (%s): Seq Scan on %s', description, ', '.join(sorted(scanned)))
+                    failures.append((description, sorted(scanned)))
+            cr.execute("RESET enable_seqscan")
+        return failures
+
+    @api.model
+    def action_check_query_plans(self):
+        failures = self._sid_check_query_plans()
+        if failures:
+            message = '\n'.join('%s: %s' % (description, ', '.join(tables)) for description, tables in failures)
+            notif_type = 'warning'
+        else:
+            message = _('Todas las consultas críticas usan índices.')
+            notif_type = 'success'
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Planes de consulta del dossier'),
+                'message': message,
+                'type': notif_type,
+                'sticky': bool(failures),
+            },
+        }
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Instrumentación opcional por pasos del wizard y del aprovisionamiento.
+
+Se activa con el parámetro de sistema `sid_projects_dossier.perf_log` (True/False).
+Cada paso con nombre registra nº de consultas, tiempo SQL y tiempo de reloj en
+`sid.dossier.perf.log`; desactivado, el perfilador no añade ninguna consulta.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from odoo import api, fields, models
+from odoo.tools import str2bool
+
+PERF_LOG_PARAM = 'sid_projects_dossier.perf_log'
+
+
+class DossierProfiler:
+    """Acumula mediciones por paso y las guarda con un único create()."""
+
+    def __init__(self, env, operation, quotation_id=False, enabled=False):
+        self.env = env
+        self.operation = operation
+        self.quotation_id = quotation_id
+        self.enabled = enabled
+        self.entries = []
+
+    @contextmanager
+    def step(self, name):
+        if not self.enabled:
+            yield
+            return
+
+        cr = self.env.cr
+        thread = threading.current_thread()
+        # sql_db solo acumula query_time si el hilo tiene los contadores.
+        if not hasattr(thread, 'query_time'):
+            thread.query_count = 0
+            thread.query_time = 0
+        # Flush para imputar las escrituras pendientes al paso que las generó.
+        self.env['base'].flush()
+        start_count = cr.sql_log_count
+        start_sql = thread.query_time
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.env['base'].flush()
+            self.entries.append({
+                'operation': self.operation,
+                'name': name,
+                'quotation_id': self.quotation_id,
+                'query_count': cr.sql_log_count - start_count,
+                'sql_time': (thread.query_time - start_sql) * 1000.0,
+                'wall_time': (time.perf_counter() - start) * 1000.0,
+            })
+
+    def save(self):
+        if self.enabled and self.entries:
+            self.env['sid.dossier.perf.log'].sudo().create(self.entries)
+            self.entries = []
+
+
+class SidDossierPerfLog(models.Model):
+    _name = 'sid.dossier.perf.log'
+    _description = 'Perfil de rendimiento del dossier'
+    _order = 'id desc'
+
+    operation = fields.Char(string='Operación', required=True, readonly=True, index=True)
+    name = fields.Char(string='Paso', required=True, readonly=True, index=True)
+    quotation_id = fields.Many2one('sale.quotations', string='Presupuesto/Contrato', readonly=True, ondelete='set null')
+    user_id = fields.Many2one('res.users', string='Usuario', default=lambda self: self.env.uid, readonly=True)
+    query_count = fields.Integer(string='Consultas', readonly=True, group_operator='avg')
+    sql_time = fields.Float(string='Tiempo SQL (ms)', readonly=True, group_operator='avg')
+    wall_time = fields.Float(string='Tiempo total (ms)', readonly=True, group_operator='avg')
+    max_wall_time = fields.Float(
+        string='Tiempo total máx. (ms)',
+        related='wall_time',
+        store=True,
+        group_operator='max',
+        readonly=True,
+    )
+
+    @api.model
+    def _sid_is_enabled(self):
+        # get_param está cacheado (ormcache): sin consulta en el camino normal.
+        return str2bool(self.env['ir.config_parameter'].sudo().get_param(PERF_LOG_PARAM, 'False'), False)
+
+    @api.model
+    def _sid_profiler(self, operation, quotation=None):
+        return DossierProfiler(
+            self.env,
+            operation,
+            quotation_id=quotation.id if quotation else False,
+            enabled=self._sid_is_enabled(),
+        )
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Cola de creación/vinculación masiva de dossieres.
+
+Las acciones masivas de `sale.order` y `sale.quotations` solo encolan líneas;
+el cron las procesa por lotes reutilizando el wizard de asignación. Cada lote
+se confirma (commit) por separado y las líneas fallidas se reintentan en
+ejecuciones posteriores hasta agotar los intentos.
+"""
+
+import logging
+import time
+
+from odoo import api, fields, models, _
+from odoo.exceptions import UserError
+
+from .documents_folder_xmlid import is_concurrent_create_error
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 20
+MAX_ATTEMPTS = 3
+# Tiempo máximo por ejecución del cron antes de re-programarse (segundos).
+CRON_TIME_BUDGET = 240
+
+
+class SidDossierQueue(models.Model):
+    _name = 'sid.dossier.queue'
+    _description = 'Cola de creación masiva de dossieres'
+    _order = 'id desc'
+
+    name = fields.Char(string='Nombre', required=True, default=lambda self: _('Creación masiva de dossieres'))
+    line_ids = fields.One2many(
+        comodel_name='sid.dossier.queue.line',
+        inverse_name='queue_id',
+        string='Contratos',
+    )
+    line_count = fields.Integer(string='Total', compute='_compute_progress')
+    done_count = fields.Integer(string='Procesados', compute='_compute_progress')
+    failed_count = fields.Integer(string='Fallidos', compute='_compute_progress')
+    progress = fields.Float(string='Progreso (%)', compute='_compute_progress')
+    state = fields.Selection(
+        selection=[
+            ('pending', 'Pendiente'),
+            ('running', 'En curso'),
+            ('done', 'Finalizado'),
+            ('failed', 'Con errores'),
+        ],
+        string='Estado',
+        compute='_compute_progress',
+    )
+
+    @api.depends('line_ids.state')
+    def _compute_progress(self):
+        counts = {}
+        if self.ids:
+            groups = self.env['sid.dossier.queue.line'].read_group(
+                [('queue_id', 'in', self.ids)],
+                ['queue_id', 'state'],
+                ['queue_id', 'state'],
+                lazy=False,
+            )
+            for group in groups:
+                counts.setdefault(group['queue_id'][0], {})[group['state']] = group['__count']
+
+        for queue in self:
+            by_state = counts.get(queue.id, {})
+            total = sum(by_state.values())
+            done = by_state.get('done', 0)
+            failed = by_state.get('failed', 0)
+            queue.line_count = total
+            queue.done_count = done
+            queue.failed_count = failed
+            queue.progress = 100.0 * (done + failed) / total if total else 0.0
+            if total and done + failed == total:
+                queue.state = 'failed' if failed else 'done'
+            elif done or failed or any(line.attempts for line in queue.line_ids):
+                queue.state = 'running'
+            else:
+                queue.state = 'pending'
+
+    # ---------------------------------------------------------------------
+    # Encolado
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_enqueue(self, quotations, sale_orders=None):
+        """Crea una cola con una línea por contrato y despierta al cron."""
+        quotations = quotations.exists()
+        if not quotations:
+            raise UserError(_('Ninguno de los registros seleccionados tiene presupuesto/contrato asociado.'))
+
+        order_by_quotation = {}
+        for order in (sale_orders or self.env['sale.order']):
+            order_by_quotation.setdefault(order.quotations_id.id, order.id)
+
+        queue = self.create({
+            'line_ids': [
+                (0, 0, {
+                    'quotation_id': quotation.id,
+                    'sale_order_id': order_by_quotation.get(quotation.id, False),
+                })
+                for quotation in quotations
+            ],
+        })
+        cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_queue', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+        return queue
+
+    def action_open(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'name': self.name,
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
+
+    def action_retry_failed(self):
+        self.line_ids.filtered(lambda l: l.state == 'failed').write({'state': 'pending', 'attempts': 0})
+        cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_queue', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    # ---------------------------------------------------------------------
+    # Cron
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _cron_process_queue(self, chunk_size=DEFAULT_CHUNK_SIZE, auto_commit=True):
+        """Procesa líneas pendientes por lotes, con commit independiente por lote."""
+        Line = self.env['sid.dossier.queue.line'].sudo()
+        started = time.monotonic()
+        seen_ids = []
+        while True:
+            lines = Line.search([('state', '=', 'pending'), ('id', 'not in', seen_ids)], limit=chunk_size, order='id')
+            if not lines:
+                return
+            seen_ids += lines.ids
+            lines._sid_process()
+            if auto_commit:
+                self.env.cr.commit()
+
+            if time.monotonic() - started > CRON_TIME_BUDGET:
+                # Quedan pendientes: continuar en una nueva ejecución.
+                cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_queue', raise_if_not_found=False)
+                if cron:
+                    cron._trigger()
+                return
+
+
+class SidDossierQueueLine(models.Model):
+    _name = 'sid.dossier.queue.line'
+    _description = 'Línea de cola de creación masiva de dossieres'
+    _order = 'queue_id, id'
+
+    queue_id = fields.Many2one(
+        comodel_name='sid.dossier.queue',
+        string='Cola',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    quotation_id = fields.Many2one('sale.quotations', string='Presupuesto/Contrato', required=True, ondelete='cascade')
+    sale_order_id = fields.Many2one('sale.order', string='Pedido', ondelete='set null')
+    state = fields.Selection(
+        selection=[('pending', 'Pendiente'), ('done', 'Hecho'), ('failed', 'Fallido')],
+        string='Estado',
+        default='pending',
+        required=True,
+        index=True,
+    )
+    attempts = fields.Integer(string='Intentos', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+    dossier_folder_id = fields.Many2one('documents.folder', string='Dossier', readonly=True)
+
+    def _sid_process(self):
+        """Crea/vincula el dossier de cada línea mediante el wizard de asignación."""
+        Wizard = self.env['sid.dossier.assign.wizard']
+        deferred = False
+        for line in self:
+            try:
+                with self.env.cr.savepoint():
+                    wizard = Wizard.with_user(line.queue_id.create_uid).with_context(
+                        default_sale_order_id=line.sale_order_id.id,
+                        default_quotation_id=line.quotation_id.id,
+                        default_mode='new',
+                        # Ya en segundo plano: la estructura se crea en la misma línea.
+                        sid_sync_provisioning=True,
+                    ).create({})
+                    wizard.action_confirm()
+            except Exception as e:
+                # El rollback deshace las carpetas creadas, pero no los ids que
+                # ya se guardaron en ormcache (root/años): se descartan para que
+                # las siguientes líneas no cuelguen su dossier de una carpeta inexistente.
+                self.env['documents.folder'].clear_caches()
+                if is_concurrent_create_error(e):
+                    # Otra transacción creó la misma carpeta: esta transacción no la
+                    # ve, se reintenta en la siguiente ejecución sin gastar intento.
+                    _logger.info('Dossier queue line %s deferred: concurrent folder creation', line.id)
+                    line.write({'error': str(e)})
+                    deferred = True
+                    continue
+                _logger.exception('Dossier queue line %s failed', line.id)
+                attempts = line.attempts + 1
+                line.write({
+                    'attempts': attempts,
+                    'error': str(e),
+                    'state': 'failed' if attempts >= MAX_ATTEMPTS else 'pending',
+                })
+            else:
+                line.write({
+                    'state': 'done',
+                    'error': False,
+                    'dossier_folder_id': line.quotation_id.dossier_effective_folder_id.id,
+                })
+        if deferred:
+            cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_queue', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
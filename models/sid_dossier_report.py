@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Informe plano de contratos con dossier (menú Ventas > Dossieres).
+
+Vista SQL de solo lectura que pre-une pedido, jerarquía de contrato, dossier
+efectivo, estado del dossier y recuentos de `sid.dossier.stat`, de modo que
+listar y agrupar sea una única consulta sin campos calculados por registro.
+"""
+
+from odoo import fields, models, tools
+
+
+class SidDossierReport(models.Model):
+    _name = 'sid.dossier.report'
+    _description = 'Contratos con dossier'
+    _auto = False
+    _rec_name = 'name'
+    _order = 'date_order desc, id desc'
+
+    sale_order_id = fields.Many2one('sale.order', string='Pedido', readonly=True)
+    name = fields.Char(string='Number', readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Cliente', readonly=True)
+    user_id = fields.Many2one('res.users', string='Comercial', readonly=True)
+    company_id = fields.Many2one('res.company', string='Compañía', readonly=True)
+    date_order = fields.Datetime(string='Order Date', readonly=True)
+    state = fields.Char(string='Estado pedido', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moneda', readonly=True)
+    amount_total = fields.Monetary(string='Total', readonly=True)
+    quotations_id = fields.Many2one('sale.quotations', string='Pedido/Contrato', readonly=True)
+    principal_quotation_id = fields.Many2one('sale.quotations', string='Contrato principal', readonly=True)
+    dossier_folder_id = fields.Many2one('documents.folder', string='Dossier', readonly=True)
+    dossier_asignado = fields.Char(string='Dossier asignado', readonly=True)
+    dossier_state = fields.Selection(
+        selection=[
+            ('suministro', 'Suministro'),
+            ('en_proceso', 'En proceso'),
+            ('enviado', 'Enviado'),
+            ('aprobado', 'Aprobado'),
+        ],
+        string='Estado del dossier',
+        readonly=True,
+    )
+    dossier_provisioning_state = fields.Selection(
+        selection=[
+            ('pending', 'Pendiente'),
+            ('running', 'En curso'),
+            ('done', 'Completada'),
+            ('failed', 'Fallida'),
+        ],
+        string='Estructura del dossier',
+        readonly=True,
+    )
+    dossier_document_count = fields.Integer(string='Documentos del dossier', readonly=True)
+    dossier_approved_count = fields.Integer(string='Documentos aprobados', readonly=True)
+    dossier_progress = fields.Float(string='Dossier completado (%)', readonly=True, group_operator='avg')
+
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute("""
+            CREATE OR REPLACE VIEW {table} AS (
+                SELECT so.id AS id,
+                       so.id AS sale_order_id,
+                       so.name AS name,
+                       so.partner_id AS partner_id,
+                       so.user_id AS user_id,
+                       so.company_id AS company_id,
+                       so.date_order AS date_order,
+                       so.state AS state,
+                       so.currency_id AS currency_id,
+                       so.amount_total AS amount_total,
+                       so.quotations_id AS quotations_id,
+                       q.dossier_root_id AS principal_quotation_id,
+                       folder.id AS dossier_folder_id,
+                       folder.name AS dossier_asignado,
+                       q.dossier_state AS dossier_state,
+                       q.dossier_provisioning_state AS dossier_provisioning_state,
+                       COALESCE(st.document_count, 0) AS dossier_document_count,
+                       COALESCE(st.approved_count, 0) AS dossier_approved_count,
+                       CASE WHEN COALESCE(st.with_estado_count, 0) > 0
+                            THEN 100.0 * st.approved_count / st.with_estado_count
+                            ELSE 0.0
+                       END AS dossier_progress
+                  FROM sale_order so
+                  LEFT JOIN sale_quotations q ON q.id = so.quotations_id
+                  LEFT JOIN documents_folder folder
+                         ON folder.id = COALESCE(q.dossier_effective_folder_id, so.dossier_folder_id)
+                  LEFT JOIN LATERAL (
+                        SELECT SUM(s.document_count) AS document_count,
+                               COALESCE(SUM(s.document_count) FILTER (WHERE s.estado = 'aprobado'), 0) AS approved_count,
+                               SUM(s.document_count) FILTER (WHERE s.estado <> 'none') AS with_estado_count
+                          FROM sid_dossier_stat s
+                         WHERE s.dossier_folder_id = folder.id
+                  ) st ON TRUE
+                 WHERE so.tiene_dossier
+                   AND so.state = 'sale'
+            )
+        """.format(table=self._table))
+
+    def action_view_dossier(self):
+        self.ensure_one()
+        return self.sale_order_id.action_view_dossier()
+
+    def action_open_sale_order(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'sale.order',
+            'res_id': self.sale_order_id.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""Estadísticas de documentos por dossier, mantenidas de forma incremental.
+
+Cada fila cuenta los documentos activos de un dossier por sección (carpeta de
+primer nivel del dossier) y estado (subcarpeta Proveedor/Enviado/...). Las
+claves se obtienen del `parent_path` de la carpeta del documento
+(root/año/dossier/sección/estado, también bajo "Archivado"), sin recorrer el
+árbol en Python.
+"""
+
+from collections import Counter
+
+from odoo import api, fields, models, _
+from odoo.exceptions import AccessError
+
+ESTADO_SELECTION = [
+    ('none', 'Sin estado'),
+    ('proveedor', 'Proveedor'),
+    ('enviado', 'Enviado'),
+    ('comentarios', 'Comentarios'),
+    ('rechazado', 'Rechazado'),
+    ('aprobado', 'Aprobado'),
+]
+ESTADO_KEYS = tuple(key for key, _label in ESTADO_SELECTION if key != 'none')
+
+# Clave (dossier, sección, estado) + nº de documentos, a partir de parent_path.
+_KEY_QUERY = """
+    SELECT split_part(f.parent_path, '/', 3)::int AS dossier_folder_id,
+           NULLIF(split_part(f.parent_path, '/', 4), '')::int AS section_folder_id,
+           CASE WHEN split_part(f.parent_path, '/', 5) <> ''
+                     AND split_part(f.parent_path, '/', 6) = ''
+                     AND lower(trim(f.name)) IN %(estados)s
+                THEN lower(trim(f.name))
+                ELSE 'none'
+           END AS estado,
+           count(*) AS document_count
+      FROM documents_document d
+      JOIN documents_folder f ON f.id = d.folder_id
+     WHERE d.active
+       AND f.parent_path LIKE ANY(%(prefixes)s)
+       AND {where}
+     GROUP BY 1, 2, 3
+"""
+
+
+class SidDossierStat(models.Model):
+    _name = 'sid.dossier.stat'
+    _description = 'Estadísticas de documentos por dossier'
+    _log_access = False
+    _order = 'dossier_folder_id, section_folder_id, estado'
+
+    dossier_folder_id = fields.Many2one(
+        comodel_name='documents.folder',
+        string='Dossier',
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True,
+    )
+    section_folder_id = fields.Many2one(
+        comodel_name='documents.folder',
+        string='Sección',
+        ondelete='cascade',
+        readonly=True,
+    )
+    estado = fields.Selection(ESTADO_SELECTION, string='Estado', required=True, default='none', readonly=True)
+    document_count = fields.Integer(string='Documentos', readonly=True)
+
+    def init(self):
+        # Clave única (sección opcional) para los upserts incrementales.
+        self.env.cr.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS sid_dossier_stat_key_uniq
+                ON sid_dossier_stat (dossier_folder_id, COALESCE(section_folder_id, 0), estado)
+        """)
+
+    # ---------------------------------------------------------------------
+    # Claves
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_query_params(self):
+        workspace_ids = self.env['documents.folder']._sid_dossier_workspace_ids()
+        return {
+            'estados': ESTADO_KEYS,
+            'prefixes': ['%s/%%/%%/%%' % workspace_id for workspace_id in workspace_ids],
+        }
+
+    @api.model
+    def _sid_document_counts(self, documents):
+        """Counter {(dossier, sección, estado): nº} de los documentos dados (estado actual en BD)."""
+        if not documents:
+            return Counter()
+        documents.flush(['folder_id', 'active'])
+        self.env['documents.folder'].flush(['parent_folder_id', 'name'])
+        params = dict(self._sid_query_params(), ids=tuple(documents.ids))
+        self.env.cr.execute(_KEY_QUERY.format(where='d.id IN %(ids)s'), params)
+        return Counter({
+            (dossier_id, section_id, estado): count
+            for dossier_id, section_id, estado, count in self.env.cr.fetchall()
+        })
+
+    # ---------------------------------------------------------------------
+    # Mantenimiento
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_apply_delta(self, delta):
+        """Suma `delta` ({clave: +/-n}) a las filas existentes con un único upsert."""
+        rows = [(dossier_id, section_id, estado, count) for (dossier_id, section_id, estado), count in delta.items() if count]
+        if not rows:
+            return
+        cr = self.env.cr
+        values = ', '.join(cr.mogrify('(%s, %s, %s, %s)', row).decode() for row in rows)
+        cr.execute("""
+            INSERT INTO sid_dossier_stat (dossier_folder_id, section_folder_id, estado, document_count)
+            VALUES {values}
+            ON CONFLICT (dossier_folder_id, COALESCE(section_folder_id, 0), estado)
+            DO UPDATE SET document_count = sid_dossier_stat.document_count + EXCLUDED.document_count
+        """.format(values=values))
+        cr.execute(
+            "DELETE FROM sid_dossier_stat WHERE document_count <= 0 AND dossier_folder_id IN %s",
+            (tuple({row[0] for row in rows}),),
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def _sid_rebuild(self, dossier_folder_ids=None):
+        """Reconstruye las estadísticas (todas, o solo las de los dossieres indicados)."""
+        self.env['documents.document'].flush(['folder_id', 'active'])
+        self.env['documents.folder'].flush(['parent_folder_id', 'name'])
+        cr = self.env.cr
+        params = self._sid_query_params()
+        if dossier_folder_ids is None:
+            cr.execute("DELETE FROM sid_dossier_stat")
+            where = 'TRUE'
+        else:
+            if not dossier_folder_ids:
+                return
+            cr.execute("DELETE FROM sid_dossier_stat WHERE dossier_folder_id IN %s", (tuple(dossier_folder_ids),))
+            where = "split_part(f.parent_path, '/', 3) IN %(dossier_ids)s"
+            params['dossier_ids'] = tuple(str(dossier_id) for dossier_id in dossier_folder_ids)
+        cr.execute(
+            "INSERT INTO sid_dossier_stat (dossier_folder_id, section_folder_id, estado, document_count) "
+            + _KEY_QUERY.format(where=where),
+            params,
+        )
+        self.invalidate_cache()
+
+    @api.model
+    def action_rebuild_all(self):
+        """Reparación: recalcula toda la tabla desde documents.document."""
+        if not self.env.user.has_group('sid_projects_dossier.group_dossier_manager'):
+            raise AccessError(_('Solo los responsables de dossier pueden reconstruir las estadísticas.'))
+        self._sid_rebuild()
+        return {'type': 'ir.actions.client', 'tag': 'reload'}
+
+    # ---------------------------------------------------------------------
+    # Lectura
+    # ---------------------------------------------------------------------
+
+    @api.model
+    def _sid_summary(self, dossier_folder_ids):
+        """{dossier_id: (nº documentos, nº aprobados, % completado)}.
+
+        El % completado es la proporción de documentos en subcarpetas de estado
+        que ya están en "Aprobado".
+        """
+        summary = {}
+        dossier_folder_ids = [dossier_id for dossier_id in set(dossier_folder_ids) if dossier_id]
+        if not dossier_folder_ids:
+            return summary
+        groups = self.read_group(
+            [('dossier_folder_id', 'in', dossier_folder_ids)],
+            ['dossier_folder_id', 'estado', 'document_count:sum'],
+            ['dossier_folder_id', 'estado'],
+            lazy=False,
+        )
+        totals = {}
+        for group in groups:
+            entry = totals.setdefault(group['dossier_folder_id'][0], {'total': 0, 'with_estado': 0, 'approved': 0})
+            count = group['document_count'] or 0
+            entry['total'] += count
+            if group['estado'] != 'none':
+                entry['with_estado'] += count
+            if group['estado'] == 'aprobado':
+                entry['approved'] += count
+        for dossier_id, entry in totals.items():
+            progress = 100.0 * entry['approved'] / entry['with_estado'] if entry['with_estado'] else 0.0
+            summary[dossier_id] = (entry['total'], entry['approved'], progress)
+        return summary
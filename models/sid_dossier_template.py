@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""Plantillas declarativas de estructura de dossier.
+
+La taxonomía de carpetas vive en datos (`sid.dossier.template` + líneas) y se
+compila una vez por registro en un árbol inmutable cacheado con `ormcache`.
+La caché se invalida únicamente cuando se modifica una plantilla o sus líneas.
+"""
+
+from collections import namedtuple
+
+from odoo import api, fields, models, tools, _
+from odoo.exceptions import UserError
+
+from .sid_projects_dossier_server_actions import normalize_match_name
+
+# Árbol compilado (inmutable: seguro para compartir entre peticiones).
+CompiledTemplate = namedtuple('CompiledTemplate', ['id', 'name', 'nodes', 'request_mode'])
+CompiledNode = namedtuple('CompiledNode', ['name', 'sequence', 'children', 'match_facets', 'create_request'])
+CompiledSubNode = namedtuple('CompiledSubNode', ['name', 'sequence'])
+
+DEFAULT_ESTADO_NAMES = 'Proveedor,Enviado,Comentarios,Rechazado,Aprobado'
+
+
+def _split_names(value):
+    return tuple(name.strip() for name in (value or '').split(',') if name.strip())
+
+
+class SidDossierTemplate(models.Model):
+    _name = 'sid.dossier.template'
+    _description = 'Plantilla de estructura de dossier'
+    _order = 'sequence, id'
+
+    name = fields.Char(string='Nombre', required=True)
+    sequence = fields.Integer(string='Secuencia', default=10)
+    active = fields.Boolean(default=True)
+    is_default = fields.Boolean(
+        string='Plantilla por defecto',
+        help='Se usa para los clientes que no tienen una plantilla específica.',
+    )
+    partner_ids = fields.Many2many(
+        comodel_name='res.partner',
+        string='Clientes',
+        help='Clientes que usan esta variante de plantilla en lugar de la plantilla por defecto.',
+    )
+    estado_names = fields.Char(
+        string='Subcarpetas de estado',
+        default=DEFAULT_ESTADO_NAMES,
+        help='Nombres separados por comas de las subcarpetas de estado, en orden.',
+    )
+    request_mode = fields.Selection(
+        selection=[
+            ('batch', 'Al crear el dossier'),
+            ('lazy', 'Al subir el primer documento'),
+            ('none', 'No generar'),
+        ],
+        string='Solicitudes de documentos',
+        required=True,
+        default='batch',
+        help='Cuándo se generan las solicitudes de las carpetas marcadas con "Crear solicitud": '
+             'todas al crear el dossier, cada una al subir el primer documento a su carpeta, o nunca '
+             '(p.ej. contratos de solo suministro).',
+    )
+    line_ids = fields.One2many(
+        comodel_name='sid.dossier.template.line',
+        inverse_name='template_id',
+        string='Carpetas',
+        copy=True,
+    )
+
+    # ---------------------------------------------------------------------
+    # Compilación / caché
+    # ---------------------------------------------------------------------
+
+    @api.model
+    @tools.ormcache('partner_id')
+    def _sid_template_id_for_partner(self, partner_id):
+        """Id de la plantilla aplicable: variante del cliente o plantilla por defecto."""
+        Template = self.sudo()
+        template = Template.browse()
+        if partner_id:
+            template = Template.search([('partner_ids', 'in', partner_id)], limit=1)
+        if not template:
+            template = Template.search([('is_default', '=', True)], limit=1)
+        return template.id
+
+    @api.model
+    @tools.ormcache('template_id')
+    def _sid_compiled_template(self, template_id):
+        """Compila la plantilla en un árbol inmutable de tuplas."""
+        template = self.sudo().browse(template_id)
+        estados = _split_names(template.estado_names)
+        nodes = []
+        for line in template.line_ids.sorted(lambda l: (l.sequence, l.id)):
+            children = []
+            if line.with_estados:
+                children += [
+                    CompiledSubNode(name, sequence)
+                    for sequence, name in enumerate(estados, start=10)
+                ]
+            if line.generator_prefix and line.generator_count > 0:
+                children += [
+                    CompiledSubNode('%s%s' % (line.generator_prefix, i), sequence)
+                    for sequence, i in enumerate(range(1, line.generator_count + 1), start=10)
+                ]
+            children += [CompiledSubNode(name, None) for name in _split_names(line.extra_subfolder_names)]
+            nodes.append(CompiledNode(
+                line.name,
+                line.sequence,
+                tuple(children),
+                line.match_facets,
+                line.create_request,
+            ))
+        return CompiledTemplate(template.id, template.name, tuple(nodes), template.request_mode)
+
+    @api.model
+    @tools.ormcache('template_id', 'workspace_id')
+    def _sid_facet_map(self, template_id, workspace_id):
+        """Facetas del workspace que corresponden a cada sección de la plantilla.
+
+        Devuelve (ids para la carpeta del dossier, ((sección, ids), ...)). Los
+        nombres se normalizan una sola vez; una faceta corresponde a una sección
+        si su nombre normalizado contiene el de la sección. Se invalida al
+        modificar plantillas, facetas o etiquetas (clear_caches).
+        """
+        template = self._sid_compiled_template(template_id)
+        facets = self.env['documents.facet'].sudo().search([('folder_id', '=', workspace_id)])
+        normalized_facets = [(facet.id, normalize_match_name(facet.name)) for facet in facets]
+        sections = []
+        for node in template.nodes:
+            if node.match_facets:
+                key = normalize_match_name(node.name)
+                sections.append((node.name, tuple(facet_id for facet_id, name in normalized_facets if key in name)))
+        parent_ids = tuple(sorted({facet_id for _name, ids in sections for facet_id in ids}))
+        return parent_ids, tuple(sections)
+
+    @api.model
+    def _sid_get_compiled_template(self, partner=None):
+        """Árbol compilado aplicable a `partner` (o el de la plantilla por defecto)."""
+        template_id = self._sid_template_id_for_partner(partner.id if partner else False)
+        if not template_id:
+            raise UserError(_('No hay ninguna plantilla de dossier por defecto configurada.'))
+        return self._sid_compiled_template(template_id)
+
+    # ---------------------------------------------------------------------
+    # Invalidación
+    # ---------------------------------------------------------------------
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.clear_caches()
+        return res
+
+
+class SidDossierTemplateLine(models.Model):
+    _name = 'sid.dossier.template.line'
+    _description = 'Carpeta de plantilla de dossier'
+    _order = 'template_id, sequence, id'
+
+    template_id = fields.Many2one(
+        comodel_name='sid.dossier.template',
+        string='Plantilla',
+        required=True,
+        ondelete='cascade',
+        index=True,
+    )
+    sequence = fields.Integer(
+        string='Secuencia',
+        default=10,
+        help='Orden de la línea; también se usa como secuencia de la carpeta creada.',
+    )
+    name = fields.Char(string='Carpeta', required=True)
+    with_estados = fields.Boolean(
+        string='Con estados',
+        default=True,
+        help='Crea las subcarpetas de estado definidas en la plantilla.',
+    )
+    generator_prefix = fields.Char(
+        string='Prefijo de subcarpetas',
+        help='Genera subcarpetas numeradas "<prefijo>1".."<prefijo>N" (p.ej. NOI-).',
+    )
+    generator_count = fields.Integer(string='Nº de subcarpetas generadas')
+    extra_subfolder_names = fields.Char(
+        string='Subcarpetas adicionales',
+        help='Nombres separados por comas de subcarpetas fijas (sin secuencia).',
+    )
+    match_facets = fields.Boolean(
+        string='Asociar facetas',
+        default=True,
+        help='Vincula las facetas del workspace cuyo nombre coincida con la carpeta.',
+    )
+    create_request = fields.Boolean(
+        string='Crear solicitud',
+        default=True,
+        help='Genera una solicitud de documentos para la carpeta.',
+    )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.clear_caches()
+        return res
@@ -1,93 +1,10 @@
 # -*- coding: utf-8 -*-
 
-from odoo import api, fields, models
+from collections import Counter, defaultdict
 
+from odoo import api, fields, models, tools
 
-class SaleOrderDossier(models.Model):
-    _inherit = 'sale.order'
-
-    # Visible/agrupable en sale.order, pero el vínculo vive en sale.quotations
-    dossier_folder_id = fields.Many2one(
-        comodel_name='documents.folder',
-        string='Dossier (carpeta)',
-        related='quotations_id.dossier_folder_id',
-        store=True,
-        readonly=True,
-    )
-    dossier_asignado = fields.Char(
-        string='Dossier asignado',
-        compute='_compute_dossier_asignado',
-        store=True,
-        readonly=True,
-    )
-    tiene_dossier = fields.Boolean(
-        string='Dossier activo',
-        compute='_compute_tiene_dossier',
-        store=True,
-        readonly=True,
-    )
-
-    @api.depends('dossier_folder_id')
-    def _compute_tiene_dossier(self):
-        for so in self:
-            so.tiene_dossier = bool(so.dossier_folder_id)
-
-    @api.depends('dossier_folder_id', 'dossier_folder_id.name')
-    def _compute_dossier_asignado(self):
-        for so in self:
-            so.dossier_asignado = so.dossier_folder_id.name if so.dossier_folder_id else ''
-
-    def action_open_dossier_wizard_create(self):
-        self.ensure_one()
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Crear dossier',
-            'res_model': 'sid.dossier.assign.wizard',
-            'view_mode': 'form',
-            'target': 'new',
-            'context': {
-                'default_sale_order_id': self.id,
-                'default_quotation_id': self.quotations_id.id if self.quotations_id else False,
-                'default_mode': 'new',
-            },
-        }
-
-    def action_open_dossier_wizard_link(self):
-        self.ensure_one()
-        return {
-            'type': 'ir.actions.act_window',
-            'name': 'Vincular dossier',
-            'res_model': 'sid.dossier.assign.wizard',
-            'view_mode': 'form',
-            'target': 'new',
-            'context': {
-                'default_sale_order_id': self.id,
-                'default_quotation_id': self.quotations_id.id if self.quotations_id else False,
-                'default_mode': 'existing',
-            },
-        }
-
-    def action_view_dossier(self):
-        self.ensure_one()
-        if not self.dossier_folder_id:
-            return self.action_open_dossier_wizard_link()
-        folder = self.dossier_folder_id
-        # Abrir DOCUMENTOS (documents.document) filtrados por la carpeta del dossier.
-        # Usamos child_of para incluir subcarpetas.
-        return {
-            'name': 'Documentos',
-            'type': 'ir.actions.act_window',
-            'res_model': 'documents.document',
-            'view_mode': 'tree,kanban,form',
-            'domain': [('folder_id', 'child_of', folder.id)],
-            'context': {
-                'default_folder_id': folder.id,
-                'searchpanel_default_folder_id': folder.id,
-                'searchpanel_default_folder_id_domain': [('folder_id', 'child_of', folder.id)],
-                'group_by': 'folder_id',
-            },
-            'target': 'current',
-        }
+from .sid_projects_dossier_server_actions import ensure_section_requests
 
 
 class DocumentsDocumentDossier(models.Model):
@@ -114,9 +31,18 @@ class DocumentsDocumentDossier(models.Model):
         'aprobado': 'APROBADO',
     }
 
+    dossier_folder_id = fields.Many2one(
+        comodel_name='documents.folder',
+        string='Dossier (carpeta)',
+        compute='_compute_dossier_folder_id',
+        store=True,
+        index=True,
+        readonly=True,
+        help='Carpeta de dossier (root/año/dossier) a la que cuelga el documento.',
+    )
     dossier_contrato = fields.Char(
         string='Dossier (contrato)',
-        compute='_compute_dossier_contrato',
+        related='dossier_folder_id.name',
         store=True,
         readonly=True,
         help='Carpeta de dossier (nivel 2) a la que cuelga el documento.',
@@ -126,7 +52,7 @@ class DocumentsDocumentDossier(models.Model):
     document_transmittal = fields.Char(string='Transmittal', store=True)
 
     def _sid_get_quality_workspace(self):
-        return self.env.ref('sid_projects_dossier.sid_workspace_quality_dossiers', raise_if_not_found=False)
+        return self.env['documents.folder']._sid_quality_root()
 
     def _sid_find_facet_by_names(self, workspace, names):
         Facet = self.env['documents.facet'].sudo()
@@ -142,82 +68,224 @@ class DocumentsDocumentDossier(models.Model):
                 return tag_name
         return False
 
-    def _sid_sync_tags_from_folder(self):
-        Tag = self.env['documents.tag'].sudo()
-        excluded_folders = {'12. Contrato', '0. Plantillas'}
+    @api.model
+    @tools.ormcache('self.env.lang', 'company_id')
+    def _sid_tag_lookup_table(self, company_id):
+        """Tabla cacheada de facetas/etiquetas del workspace de calidad de la compañía.
 
-        workspace = self._sid_get_quality_workspace()
+        Devuelve (doc_facet_id, estado_facet_id, {nombre: tag_id DOC}, {nombre: tag_id ESTADO}).
+        Se invalida al modificar facetas o etiquetas de Documents.
+        """
+        Folder = self.env['documents.folder']
+        workspace = Folder.browse(Folder._sid_quality_root_id(company_id))
         if not workspace:
-            return
+            return False, False, {}, {}
 
         doc_facet = self._sid_find_facet_by_names(workspace, ['DOC', 'ITP'])
         estado_facet = self._sid_find_facet_by_names(workspace, ['ESTADO', 'PLANOS'])
-        if not doc_facet and not estado_facet:
-            return
+        tags_by_facet = {doc_facet.id: {}, estado_facet.id: {}}
+        facets = doc_facet | estado_facet
+        if facets:
+            # Mismo criterio que search(..., limit=1): primera etiqueta según el orden del modelo.
+            for tag in self.env['documents.tag'].sudo().search([('facet_id', 'in', facets.ids)]):
+                tags_by_facet[tag.facet_id.id].setdefault(tag.name, tag.id)
+        return doc_facet.id, estado_facet.id, tags_by_facet[doc_facet.id], tags_by_facet[estado_facet.id]
 
-        for doc in self:
-            folder = doc.folder_id
-            if not folder or not folder.parent_folder_id or folder.name in excluded_folders:
-                continue
+    def _sid_folder_tag_targets(self, folders, doc_tags, estado_tags):
+        """Resuelve una sola vez por carpeta el par (tag DOC, tag ESTADO) objetivo.
 
+        Devuelve {folder_id: (doc_tag_id, estado_tag_id)}; las carpetas excluidas no aparecen.
+        """
+        excluded_folders = {'12. Contrato', '0. Plantillas'}
+        targets = {}
+        for folder in folders:
+            if not folder.parent_folder_id or folder.name in excluded_folders:
+                continue
             doc_tag_name = self._sid_pick_tag_name(folder.parent_folder_id.name, self._SID_DOC_TAG_BY_PARENT_KEYWORD)
             estado_tag_name = self._sid_pick_tag_name(folder.name, self._SID_ESTADO_TAG_BY_FOLDER_KEYWORD)
+            targets[folder.id] = (
+                doc_tags.get(doc_tag_name, False) if doc_tag_name else False,
+                estado_tags.get(estado_tag_name, False) if estado_tag_name else False,
+            )
+        return targets
 
-            target_doc_tag = Tag
-            target_estado_tag = Tag
-            if doc_facet and doc_tag_name:
-                target_doc_tag = Tag.search([
-                    ('facet_id', '=', doc_facet.id),
-                    ('name', '=', doc_tag_name),
-                ], limit=1)
-            if estado_facet and estado_tag_name:
-                target_estado_tag = Tag.search([
-                    ('facet_id', '=', estado_facet.id),
-                    ('name', '=', estado_tag_name),
-                ], limit=1)
+    def _sid_sync_tags_from_folder(self):
+        doc_facet_id, estado_facet_id, doc_tags, estado_tags = self._sid_tag_lookup_table(self.env.company.id)
+        if not doc_facet_id and not estado_facet_id:
+            return
 
-            commands = []
-            if doc_facet:
-                current_doc_tags = doc.tag_ids.filtered(lambda t: t.facet_id.id == doc_facet.id)
-                for current_tag in current_doc_tags:
-                    if not target_doc_tag or current_tag.id != target_doc_tag.id:
-                        commands.append((3, current_tag.id))
-                if target_doc_tag and target_doc_tag.id not in doc.tag_ids.ids:
-                    commands.append((4, target_doc_tag.id))
+        targets = self._sid_folder_tag_targets(self.mapped('folder_id'), doc_tags, estado_tags)
 
-            if estado_facet:
-                current_estado_tags = doc.tag_ids.filtered(lambda t: t.facet_id.id == estado_facet.id)
-                for current_tag in current_estado_tags:
-                    if not target_estado_tag or current_tag.id != target_estado_tag.id:
+        # Agrupamos los documentos por los comandos que necesitan: un write por grupo.
+        docs_by_commands = defaultdict(list)
+        for doc in self:
+            if doc.folder_id.id not in targets:
+                continue
+            target_doc_tag_id, target_estado_tag_id = targets[doc.folder_id.id]
+            current_tag_ids = doc.tag_ids.ids
+
+            commands = []
+            for facet_id, target_tag_id in ((doc_facet_id, target_doc_tag_id), (estado_facet_id, target_estado_tag_id)):
+                if not facet_id:
+                    continue
+                for current_tag in doc.tag_ids:
+                    if current_tag.facet_id.id == facet_id and current_tag.id != target_tag_id:
                         commands.append((3, current_tag.id))
-                if target_estado_tag and target_estado_tag.id not in doc.tag_ids.ids:
-                    commands.append((4, target_estado_tag.id))
+                if target_tag_id and target_tag_id not in current_tag_ids:
+                    commands.append((4, target_tag_id))
 
             if commands:
-                doc.write({'tag_ids': commands})
+                docs_by_commands[tuple(commands)].append(doc.id)
+
+        for commands, doc_ids in docs_by_commands.items():
+            self.browse(doc_ids).write({'tag_ids': list(commands)})
 
     @api.model_create_multi
     def create(self, vals_list):
         records = super().create(vals_list)
         records._sid_sync_tags_from_folder()
+        Stat = self.env['sid.dossier.stat'].sudo()
+        Stat._sid_apply_delta(Stat._sid_document_counts(records))
+        records._sid_create_lazy_requests()
         return records
 
     def write(self, vals):
+        Stat = self.env['sid.dossier.stat'].sudo()
+        track_stats = 'folder_id' in vals or 'active' in vals
+        if track_stats:
+            before = Stat._sid_document_counts(self)
         res = super().write(vals)
         if 'folder_id' in vals:
             self._sid_sync_tags_from_folder()
+        if track_stats:
+            delta = Stat._sid_document_counts(self)
+            delta.subtract(before)
+            Stat._sid_apply_delta(delta)
         return res
 
-    @api.depends('folder_id', 'folder_id.parent_folder_id', 'folder_id.parent_folder_id.parent_folder_id')
-    def _compute_dossier_contrato(self):
-        root = self.env.ref('sid_projects_dossier.sid_workspace_quality_dossiers', raise_if_not_found=False)
+    def unlink(self):
+        Stat = self.env['sid.dossier.stat'].sudo()
+        before = Stat._sid_document_counts(self)
+        res = super().unlink()
+        Stat._sid_apply_delta(Counter({key: -count for key, count in before.items()}))
+        return res
+
+    def _sid_create_lazy_requests(self):
+        """Crea las solicitudes diferidas de las secciones que reciben su primer documento."""
+        root = self._sid_get_quality_workspace()
+        if not root:
+            return
+        # parent_path = "root/año/dossier/sección/...": la sección es el 4º segmento.
+        dossier_by_section = {}
         for doc in self:
-            dossier_folder = False
-            folder = doc.folder_id
-            while folder and folder.parent_folder_id:
-                # Dossier folder is the one whose grandparent is the root
-                if root and folder.parent_folder_id.parent_folder_id and folder.parent_folder_id.parent_folder_id.id == root.id:
-                    dossier_folder = folder
-                    break
-                folder = folder.parent_folder_id
-            doc.dossier_contrato = dossier_folder.name if dossier_folder else ''
+            segments = (doc.folder_id.parent_path or '').split('/')
+            if len(segments) > 4 and segments[0] == str(root.id):
+                dossier_by_section[int(segments[3])] = int(segments[2])
+        if not dossier_by_section:
+            return
+        Folder = self.env['documents.folder'].sudo()
+        sections = Folder.browse(list(dossier_by_section)).filtered('sid_request_pending')
+        if not sections:
+            return
+        sections_by_dossier = defaultdict(lambda: Folder)
+        for section in sections:
+            sections_by_dossier[dossier_by_section[section.id]] |= section
+        for dossier_id, dossier_sections in sections_by_dossier.items():
+            ensure_section_requests(self.env, Folder.browse(dossier_id), dossier_sections)
+        sections.write({'sid_request_pending': False})
+
+    def _auto_init(self):
+        # Al añadir las columnas en una BD con documentos, las rellenamos por SQL
+        # para evitar el recálculo ORM documento a documento.
+        cr = self.env.cr
+        fill = False
+        if not tools.column_exists(cr, self._table, 'dossier_folder_id'):
+            tools.create_column(cr, self._table, 'dossier_folder_id', 'int4')
+            fill = True
+        if not tools.column_exists(cr, self._table, 'dossier_contrato'):
+            tools.create_column(cr, self._table, 'dossier_contrato', 'varchar')
+            fill = True
+        res = super()._auto_init()
+        if fill:
+            self._sid_fill_dossier_folder_sql()
+        return res
+
+    def _sid_fill_dossier_folder_sql(self, folder_ids=None):
+        """Recalcula dossier_folder_id/dossier_contrato en una pasada SQL.
+
+        Sin `folder_ids` recalcula todos los documentos; si no, solo los de esas carpetas.
+        """
+        workspace_ids = self.env['documents.folder']._sid_dossier_workspace_ids()
+        prefixes = ['%s/%%/%%/%%' % workspace_id for workspace_id in workspace_ids]
+        where = "f.id IN %(folder_ids)s" if folder_ids is not None else "TRUE"
+        self.env.cr.execute("""
+            UPDATE documents_document d
+               SET dossier_folder_id = t.dossier_id,
+                   dossier_contrato = dossier.name
+              FROM documents_folder f
+              CROSS JOIN LATERAL (
+                  SELECT CASE WHEN f.parent_path LIKE ANY(%(prefixes)s)
+                              THEN split_part(f.parent_path, '/', 3)::int END AS dossier_id
+              ) t
+              LEFT JOIN documents_folder dossier ON dossier.id = t.dossier_id
+             WHERE f.id = d.folder_id
+               AND {where}
+               AND (d.dossier_folder_id IS DISTINCT FROM t.dossier_id
+                    OR d.dossier_contrato IS DISTINCT FROM dossier.name)
+        """.format(where=where), {'prefixes': prefixes, 'folder_ids': tuple(folder_ids or ()) or (0,)})
+        self.invalidate_cache(['dossier_folder_id', 'dossier_contrato'])
+
+    @api.depends('folder_id', 'folder_id.parent_path')
+    def _compute_dossier_folder_id(self):
+        # parent_path = "root/año/dossier/..." (o "Archivado/año/dossier/..."): el
+        # dossier es siempre el 3er segmento. Mover una carpeta reescribe
+        # parent_path de todos sus descendientes, lo que dispara el recálculo de
+        # cualquier documento del subárbol.
+        workspace_ids = self.env['documents.folder']._sid_dossier_workspace_ids()
+        workspace_segments = {str(workspace_id) for workspace_id in workspace_ids}
+        for doc in self:
+            segments = (doc.folder_id.parent_path or '').split('/')
+            if len(segments) > 3 and segments[0] in workspace_segments:
+                doc.dossier_folder_id = int(segments[2])
+            else:
+                doc.dossier_folder_id = False
+
+
+class DocumentsTagDossier(models.Model):
+    _inherit = 'documents.tag'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['documents.document'].clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['documents.document'].clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['documents.document'].clear_caches()
+        return res
+
+
+class DocumentsFacetDossier(models.Model):
+    _inherit = 'documents.facet'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env['documents.document'].clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super().write(vals)
+        self.env['documents.document'].clear_caches()
+        return res
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['documents.document'].clear_caches()
+        return res
@@ -2,174 +2,189 @@
 """Funciones auxiliares reutilizadas por wizard/acciones.
 
 Notas de diseño:
-- Se respeta la estructura y lógica de la acción existente `action_create_dossier_folders`
-  (nomenclatura de carpetas, subcarpetas de estado, NOI y Adendas).
+- La taxonomía (nomenclatura de carpetas, subcarpetas de estado, NOI y Adendas) se
+  define en `sid.dossier.template`; la plantilla por defecto replica la acción
+  existente `action_create_dossier_folders`.
 - La función es idempotente: si parte de la estructura ya existe, no la duplica.
 """
 
+import logging
+from collections import defaultdict
+
 from odoo import _
 
+_logger = logging.getLogger(__name__)
+
+# Signos que la acción original eliminaba antes de comparar nombres.
+_MATCH_STRIP_TABLE = str.maketrans('', '', ",.;:?!@#$%^&*()_-+=<>/\\|[]{}")
+
+
+def normalize_match_name(name):
+    """Nombre en minúsculas y sin signos de puntuación (una sola pasada)."""
+    return (name or "").lower().translate(_MATCH_STRIP_TABLE)
+
+
+def _read_subtree_index(Folder, root):
+    """Lee todo el subárbol existente bajo `root` en una sola consulta.
+
+    Devuelve un índice {(parent_id, name): carpeta}. Si hay duplicados se queda
+    con el primero según el orden del modelo, igual que `search(..., limit=1)`.
+    """
+    index = {}
+    descendants = Folder.search([('id', 'child_of', root.id), ('id', '!=', root.id)])
+    for folder in descendants:
+        index.setdefault((folder.parent_folder_id.id, folder.name), folder)
+    return index
+
 
-def _is_similar(name, targets):
-    """Replica la lógica de "similitud" de la acción original."""
-    characters_to_remove = ",.;:?!@#$%^&*()_-+=<>/\\|[]{}"
-    cleaned_name = (name or "").lower()
-    for char in characters_to_remove:
-        cleaned_name = cleaned_name.replace(char, "")
-    for target in targets:
-        cleaned_target = (target or "").lower()
-        for char in characters_to_remove:
-            cleaned_target = cleaned_target.replace(char, "")
-        if cleaned_target in cleaned_name:
-            return True
-    return False
-
-
-def _get_or_create_folder(Folder, parent_id, name, **extra_vals):
-    """Busca/crea carpeta hija por nombre (idempotente)."""
-    folder = Folder.search([
-        ('parent_folder_id', '=', parent_id),
-        ('name', '=', name),
-    ], limit=1)
-    if folder:
-        # Actualizamos solo si se pasan valores explícitos.
-        if extra_vals:
-            folder.write(extra_vals)
-        return folder
-    vals = {'name': name, 'parent_folder_id': parent_id}
-    vals.update(extra_vals or {})
-    return Folder.create(vals)
-
-
-def create_dossier_structure(env, workspace_parent_1):
+def _ensure_folder_level(Folder, index, specs):
+    """Asegura un nivel completo de carpetas con un único `create(vals_list)`.
+
+    Args:
+        Folder: modelo documents.folder
+        index (dict): índice {(parent_id, name): carpeta}; se actualiza in situ
+        specs (list): tuplas (parent_id, name, extra_vals)
+
+    Las carpetas existentes solo se escriben si algún valor ha cambiado.
+    Devuelve las carpetas en el mismo orden que `specs`.
+    """
+    vals_list = []
+    for parent_id, name, extra_vals in specs:
+        folder = index.get((parent_id, name))
+        if folder:
+            changed = {key: value for key, value in extra_vals.items() if folder[key] != value}
+            if changed:
+                folder.write(changed)
+            continue
+        vals = {'name': name, 'parent_folder_id': parent_id}
+        vals.update(extra_vals)
+        vals_list.append(vals)
+
+    if vals_list:
+        for folder in Folder.create(vals_list):
+            index[(folder.parent_folder_id.id, folder.name)] = folder
+
+    return [index[(parent_id, name)] for parent_id, name, _extra in specs]
+
+
+def ensure_section_requests(env, dossier_folder, section_folders):
+    """Crea las solicitudes de documentos que falten para `section_folders`.
+
+    Una búsqueda para todas las secciones y un único `create(vals_list)`.
+    No hace nada si el modelo `documents.request` no está disponible.
+    """
+    Request = env.get('documents.request')
+    if Request is None or not section_folders:
+        return
+    Request = Request.sudo()
+    names = {
+        folder.id: f"Solicitud para {dossier_folder.name} / {folder.name}"
+        for folder in section_folders
+    }
+    existing = {
+        (request.folder_id.id, request.name)
+        for request in Request.search([('folder_id', 'in', list(names))])
+    }
+    vals_list = [
+        {'name': name, 'folder_id': folder_id, 'owner_id': env.user.id}
+        for folder_id, name in names.items()
+        if (folder_id, name) not in existing
+    ]
+    if vals_list:
+        Request.create(vals_list)
+
+
+def _apply_facet_links(Folder, links, errors):
+    """Añade facetas a carpetas: {carpeta: ids de faceta}.
+
+    Solo se escriben las facetas que faltan, con un write por conjunto
+    distinto de facetas. Los fallos se registran en el log y en `errors`
+    sin abortar la transacción (savepoint).
+    """
+    by_facets = defaultdict(list)
+    for folder, facet_ids in links.items():
+        missing = tuple(sorted(set(facet_ids) - set(folder.facet_ids.ids)))
+        if missing:
+            by_facets[missing].append(folder.id)
+    for facet_ids, folder_ids in by_facets.items():
+        folders = Folder.browse(folder_ids)
+        try:
+            with Folder.env.cr.savepoint():
+                folders.write({'facet_ids': [(4, facet_id) for facet_id in facet_ids]})
+        except Exception as e:
+            _logger.warning('Could not link facets %s to folders %s', facet_ids, folder_ids, exc_info=True)
+            errors.append(_('No se pudieron asociar facetas a %s: %s') % (', '.join(folders.mapped('name')), e))
+
+
+def create_dossier_structure(env, workspace_parent_1, template=None, profiler=None, errors=None):
     """Crea (o completa) la estructura de subcarpetas del dossier.
 
     Args:
         env: Environment
         workspace_parent_1 (documents.folder): carpeta raíz del dossier (contrato o adenda)
+        template (CompiledTemplate): árbol compilado de `sid.dossier.template`;
+            por defecto, el de la plantilla por defecto.
+        profiler (DossierProfiler): perfilador del llamante; si no se pasa, se
+            usa uno propio que se guarda al terminar.
+        errors (list): si se pasa, recibe los avisos no bloqueantes (p.ej.
+            facetas que no se pudieron asociar).
     """
     Folder = env['documents.folder'].sudo()
-    Request = env.get('documents.request')
-
-    # Plantilla de facetas sin ID hardcodeado: usar XML-ID canónico del módulo.
-    facets_template_folder = env.ref('sid_projects_dossier.sid_workspace_quality_dossiers', raise_if_not_found=False)
-    if not facets_template_folder:
-        facets_template_folder = workspace_parent_1
-
-    # Nombres de carpetas (exactamente como la acción original).
-    child_folders = [
-        '0. Plantillas',
-        '1. Lista de documentos',
-        '2. MPR',
-        '3. Schedule',
-        '4. Lista de materiales',
-        '5. Packing List',
-        '6.a ITP',
-        '6.b Notificaciones',
-        '6.b Autorizaciones de Envío',
-        '7.a Planos',
-        '7.b Datasheets',
-        '7.c Lista de Repuestos',
-        '8. Quality Plan',
-        '9. Procedimientos',
-        '10.a Certificados',
-        '10.b Marcado CE/UKCA',
-        '10.c Conformidad',
-        '11. Logística',
-        '12. Dossier Final',
-        '13. Contrato',
-        '14. KOM',
-        '15. Milestones',
+    own_profiler = profiler is None
+    if own_profiler:
+        profiler = env['sid.dossier.perf.log']._sid_profiler('create_dossier_structure')
+    if template is None:
+        template = env['sid.dossier.template']._sid_get_compiled_template()
+
+    if errors is None:
+        errors = []
+
+    # 1) Crear/Completar estructura nivel a nivel: una lectura del subárbol
+    #    y un create(vals_list) por nivel en lugar de search/create por nodo.
+    with profiler.step('provisioning.read_subtree'):
+        index = _read_subtree_index(Folder, workspace_parent_1)
+
+    child_specs = [
+        (workspace_parent_1.id, node.name, {'sequence': node.sequence})
+        for node in template.nodes
     ]
-    estados = ['Proveedor', 'Enviado', 'Comentarios', 'Rechazado', 'Aprobado']
-    folders_sin_estado = [
-        '0. Plantillas',
-        '6.b Notificaciones',
-        '6.b Autorizaciones de Envío',
-        '11. Logística',
-        '13. Contrato',
-        '14. KOM',
-        '15. Milestones',
+    with profiler.step('provisioning.level_1'):
+        workspace_children = _ensure_folder_level(Folder, index, child_specs)
+
+    # Subcarpetas (estados, generadas tipo NOI y fijas como Adendas)
+    sub_specs = [
+        (workspace_child.id, sub.name, {'sequence': sub.sequence} if sub.sequence is not None else {})
+        for node, workspace_child in zip(template.nodes, workspace_children)
+        for sub in node.children
     ]
-    notificaciones = ['6.b Notificaciones']
-    noi = [f'NOI-{i}' for i in range(1, 11)]
-    contrato = ['13. Contrato']
-    adenda = ['Adendas']
-
-    # 1) Facetas para el padre (carpeta raíz del dossier)
-    try:
-        similar_facets_parent = facets_template_folder.facet_ids.filtered(lambda f: _is_similar(f.name, child_folders))
-        if similar_facets_parent:
-            workspace_parent_1.write({'facet_ids': [(4, facet.id) for facet in similar_facets_parent]})
-    except Exception:
-        # No bloqueamos el proceso por facetas.
-        pass
-
-    # 2) Crear/Completar estructura
-    sequence = 10
-    user_id = env.user.id
-
-    for folder_name in child_folders:
-        workspace_child = _get_or_create_folder(
-            Folder,
-            workspace_parent_1.id,
-            folder_name,
-            sequence=sequence,
-        )
-
-        # Subcarpetas por estado (si aplica)
-        if folder_name not in folders_sin_estado:
-            seq_estado = 10
-            for folder_name_estado in estados:
-                _get_or_create_folder(
-                    Folder,
-                    workspace_child.id,
-                    folder_name_estado,
-                    sequence=seq_estado,
-                )
-                seq_estado += 1
-
-        # Subcarpetas NOI
-        if folder_name in notificaciones:
-            seq_noi = 10
-            for folder_name_noi in noi:
-                _get_or_create_folder(
-                    Folder,
-                    workspace_child.id,
-                    folder_name_noi,
-                    sequence=seq_noi,
-                )
-                seq_noi += 1
-
-        # Subcarpeta Adendas
-        if folder_name in contrato:
-            for folder_name_adenda in adenda:
-                _get_or_create_folder(
-                    Folder,
-                    workspace_child.id,
-                    folder_name_adenda,
-                )
-
-        # Facetas para cada hijo
-        try:
-            similar_facets_child = facets_template_folder.facet_ids.filtered(lambda f: _is_similar(f.name, [folder_name]))
-            if similar_facets_child:
-                workspace_child.write({'facet_ids': [(4, facet.id) for facet in similar_facets_child]})
-        except Exception:
-            pass
-
-        # Solicitud de documentos (idempotente)
-        if Request:
-            request_model = Request.sudo()
-            req_name = f"Solicitud para {workspace_parent_1.name} / {workspace_child.name}"
-            existing_req = request_model.search([('name', '=', req_name), ('folder_id', '=', workspace_child.id)], limit=1)
-            if not existing_req:
-                request_model.create({
-                    'name': req_name,
-                    'folder_id': workspace_child.id,
-                    'owner_id': user_id,
-                })
-
-        sequence += 1
-
+    with profiler.step('provisioning.level_2'):
+        _ensure_folder_level(Folder, index, sub_specs)
+
+    # 2) Facetas del workspace de calidad (tabla sección -> facetas precompilada
+    #    y cacheada): carpeta del dossier y secciones, solo las que faltan.
+    with profiler.step('provisioning.facets'):
+        facet_workspace = Folder._sid_quality_root() or workspace_parent_1
+        parent_facet_ids, section_facet_ids = env['sid.dossier.template']._sid_facet_map(template.id, facet_workspace.id)
+        section_facet_ids = dict(section_facet_ids)
+        links = {workspace_parent_1: parent_facet_ids}
+        for node, workspace_child in zip(template.nodes, workspace_children):
+            if node.match_facets:
+                links[workspace_child] = section_facet_ids.get(node.name, ())
+        _apply_facet_links(Folder, links, errors)
+
+    # Solicitudes de documentos según la plantilla: todas ahora (en bloque),
+    # al subir el primer documento a cada sección (diferidas) o ninguna.
+    request_sections = Folder.browse([
+        workspace_child.id
+        for node, workspace_child in zip(template.nodes, workspace_children)
+        if node.create_request
+    ])
+    with profiler.step('provisioning.requests'):
+        if template.request_mode == 'batch':
+            ensure_section_requests(env, workspace_parent_1, request_sections)
+        elif template.request_mode == 'lazy' and env.get('documents.request') is not None:
+            request_sections.filtered(lambda f: not f.sid_request_pending).write({'sid_request_pending': True})
+
+    if own_profiler:
+        profiler.save()
     return True
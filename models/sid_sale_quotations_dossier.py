@@ -1,13 +1,34 @@
 # -*- coding: utf-8 -*-
 
+import logging
+import time
 from datetime import date
 
 from odoo import api, fields, models, _
-from odoo.exceptions import UserError, ValidationError
+from odoo.exceptions import AccessError, UserError, ValidationError
+
+from .sid_projects_dossier_server_actions import create_dossier_structure
+
+_logger = logging.getLogger(__name__)
+
+# Aprovisionamiento diferido de la estructura del dossier (cron).
+PROVISIONING_CHUNK_SIZE = 10
+# Tiempo máximo por ejecución del cron antes de re-programarse (segundos).
+PROVISIONING_TIME_BUDGET = 240
+# Un trabajo "En curso" sin cambios durante este tiempo se da por interrumpido.
+PROVISIONING_STALE_AFTER = 3600
+
+# Campos almacenados de sale.order que dependen del dossier del contrato.
+SID_ORDER_DOSSIER_FIELDS = ('dossier_folder_id', 'principal_dossier_folder_id', 'dossier_asignado', 'tiene_dossier')
 
 
 class SaleQuotationsDossier(models.Model):
     _inherit = 'sale.quotations'
+    # Jerarquía materializada (principal/adendas): child_of como prefijo indexado
+    # y raíz del contrato resoluble sin recorrer parent_id registro a registro.
+    _parent_store = True
+
+    parent_path = fields.Char(index=True)
 
     def _get_parent_id_domain(self):
         """Limita parent_id a contratos principales del mismo cliente."""
@@ -19,9 +40,9 @@ class SaleQuotationsDossier(models.Model):
             return domain
 
         if 'sale_order_id' in self._fields and self.sale_order_id and self.sale_order_id.partner_id:
-            partner = self.sale_order_id.partner_id
-            sale_orders = self.env['sale.order'].search([('partner_id', '=', partner.id)]).ids
-            domain.append(('sale_order_id', 'in', sale_orders or [0]))
+            # Dominio relacional: Postgres lo resuelve como subconsulta sobre sale_order
+            # (indexado por partner_id) en vez de enviar todos los ids de pedidos del cliente.
+            domain.append(('sale_order_id.partner_id', '=', self.sale_order_id.partner_id.id))
 
         return domain
 
@@ -30,17 +51,75 @@ class SaleQuotationsDossier(models.Model):
         self.ensure_one()
         return {'domain': {'parent_id': self._get_parent_id_domain()}}
 
+    def _sid_parent_partner_violations(self):
+        """Contratos cuyo parent_id no está permitido por `_get_parent_id_domain`.
+
+        Se evalúa todo el recordset en una sola consulta que compara cada
+        registro con su padre. Devuelve [(id, nombre, nombre del padre)].
+        """
+        with_parent = self.filtered('parent_id')
+        if not with_parent:
+            return []
+        if any(
+            fname in self._fields and not self._fields[fname].store
+            for fname in ('partner_id', 'sale_order_id')
+        ):
+            # Sin columna no hay comparación en SQL: se evalúa el dominio con el ORM.
+            return [
+                (q.id, q.name, q.parent_id.name)
+                for q in with_parent.sorted('id')
+                if not q.parent_id.filtered_domain(q._get_parent_id_domain())
+                or ('active' in self._fields and not q.parent_id.active)
+            ]
+        stored = {
+            fname for fname in ('parent_id', 'partner_id', 'sale_order_id', 'active')
+            if fname in self._fields and self._fields[fname].store
+        }
+        self.flush(list(stored))
+        if 'sale_order_id' in stored:
+            self.env['sale.order'].flush(['partner_id'])
+
+        joins = []
+        violations = [
+            'p.id = q.id',
+            # El padre debe ser un contrato principal
+            'p.parent_id IS NOT NULL',
+        ]
+        if 'active' in stored:
+            violations.append('p.active IS NOT TRUE')
+        partner_check = []
+        if 'partner_id' in stored:
+            partner_check.append('(q.partner_id IS NOT NULL AND p.partner_id IS DISTINCT FROM q.partner_id)')
+        if 'sale_order_id' in stored:
+            joins += [
+                'LEFT JOIN sale_order qso ON qso.id = q.sale_order_id',
+                'LEFT JOIN sale_order pso ON pso.id = p.sale_order_id',
+            ]
+            without_partner = 'q.partner_id IS NULL AND ' if 'partner_id' in stored else ''
+            partner_check.append(
+                '(%sqso.partner_id IS NOT NULL AND pso.partner_id IS DISTINCT FROM qso.partner_id)' % without_partner
+            )
+        violations += partner_check
+
+        self.env.cr.execute("""
+            SELECT q.id, q.name, p.name
+              FROM sale_quotations q
+              JOIN sale_quotations p ON p.id = q.parent_id
+              {joins}
+             WHERE q.id IN %s
+               AND ({violations})
+             ORDER BY q.id
+        """.format(joins='\n'.join(joins), violations=' OR '.join(violations)), (tuple(with_parent.ids),))
+        return self.env.cr.fetchall()
+
     @api.constrains('parent_id', 'partner_id')
     def _check_parent_partner_consistency(self):
-        for quotation in self:
-            if not quotation.parent_id:
-                continue
-
-            allowed_parent_ids = quotation.search(quotation._get_parent_id_domain()).ids
-            if quotation.parent_id.id not in allowed_parent_ids:
-                raise ValidationError(_(
-                    'El contrato principal debe pertenecer al mismo cliente que el pedido/contrato actual.'
-                ))
+        violations = self._sid_parent_partner_violations()
+        if violations:
+            raise ValidationError(_(
+                'El contrato principal debe pertenecer al mismo cliente que el pedido/contrato actual. '
+                'Registros incorrectos:\n%s'
+            ) % '\n'.join('- %s → %s' % (name, parent_name) for _id, name, parent_name in violations))
 
     dossier_root_id = fields.Many2one(
         comodel_name='sale.quotations',
@@ -97,9 +176,53 @@ class SaleQuotationsDossier(models.Model):
         readonly=True,
     )
 
-    @api.depends('parent_id')
+    dossier_document_count = fields.Integer(
+        string='Documentos del dossier',
+        compute='_compute_dossier_stats',
+    )
+    dossier_progress = fields.Float(
+        string='Dossier completado (%)',
+        compute='_compute_dossier_stats',
+        help='Porcentaje de documentos en subcarpetas de estado que están aprobados.',
+    )
+
+    dossier_provisioning_state = fields.Selection(
+        selection=[
+            ('pending', 'Pendiente'),
+            ('running', 'En curso'),
+            ('done', 'Completada'),
+            ('failed', 'Fallida'),
+        ],
+        string='Estructura del dossier',
+        readonly=True,
+        copy=False,
+        help='Estado de la creación de subcarpetas del dossier cuando se aprovisiona en segundo plano.',
+    )
+    dossier_provisioning_error = fields.Text(string='Error de estructura', readonly=True, copy=False)
+
+    @api.depends('dossier_effective_folder_id')
+    def _compute_dossier_stats(self):
+        summary = self.env['sid.dossier.stat'].sudo()._sid_summary(self.mapped('dossier_effective_folder_id').ids)
+        for q in self:
+            count, _approved, progress = summary.get(q.dossier_effective_folder_id.id, (0, 0, 0.0))
+            q.dossier_document_count = count
+            q.dossier_progress = progress
+
+    @api.constrains('parent_id')
+    def _check_parent_recursion(self):
+        if not self._check_recursion():
+            raise ValidationError(_('No se puede crear una jerarquía recursiva de contratos (un contrato no puede ser adenda de sí mismo ni de sus adendas).'))
+
+    @api.depends('parent_id', 'parent_path')
     def _compute_dossier_root_id(self):
+        # parent_path = "raíz/.../id/": la raíz es el primer segmento. Re-parentar un
+        # contrato reescribe parent_path de todos sus descendientes, que se recalculan
+        # en la misma pasada.
         for q in self:
+            if q.parent_path:
+                q.dossier_root_id = int(q.parent_path.split('/', 1)[0])
+                continue
+            # Registros aún no guardados (onchange): recorrido clásico.
             root = q
             seen = set()
             while root.parent_id and root.id not in seen:
@@ -174,6 +297,101 @@ class SaleQuotationsDossier(models.Model):
             },
         }
 
+    def action_enqueue_dossier_creation(self):
+        """Encola la creación/vinculación de dossier de los contratos seleccionados."""
+        queue = self.env['sid.dossier.queue']._sid_enqueue(self)
+        return queue.action_open()
+
+    # ---------------------------------------------------------------------
+    # Aprovisionamiento diferido de la estructura
+    # ---------------------------------------------------------------------
+
+    def _sid_schedule_dossier_provisioning(self):
+        """Deja la estructura del dossier pendiente y despierta al cron."""
+        self.sudo().write({'dossier_provisioning_state': 'pending', 'dossier_provisioning_error': False})
+        cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_provisioning', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+
+    def action_retry_dossier_provisioning(self):
+        self.filtered(lambda q: q.dossier_provisioning_state == 'failed')._sid_schedule_dossier_provisioning()
+
+    def _sid_provision_dossier(self):
+        """Crea/completa la estructura del dossier de cada contrato (un savepoint por contrato)."""
+        Wizard = self.env['sid.dossier.assign.wizard']
+        for quotation in self:
+            errors = []
+            try:
+                with self.env.cr.savepoint():
+                    if not quotation.dossier_folder_id:
+                        raise UserError(_('El contrato no tiene carpeta de dossier.'))
+                    profiler = self.env['sid.dossier.perf.log']._sid_profiler('provisioning', quotation)
+                    create_dossier_structure(
+                        self.env,
+                        quotation.dossier_folder_id,
+                        template=Wizard._get_dossier_template(quotation),
+                        profiler=profiler,
+                        errors=errors,
+                    )
+                    profiler.save()
+            except Exception as e:
+                _logger.exception('Dossier provisioning failed for sale.quotations %s', quotation.id)
+                quotation.write({'dossier_provisioning_state': 'failed', 'dossier_provisioning_error': str(e)})
+            else:
+                # Avisos no bloqueantes (p.ej. facetas) quedan visibles junto al estado.
+                quotation.write({
+                    'dossier_provisioning_state': 'done',
+                    'dossier_provisioning_error': '\n'.join(errors) or False,
+                })
+
+    @api.model
+    def _cron_provision_dossiers(self, chunk_size=PROVISIONING_CHUNK_SIZE, auto_commit=True):
+        """Procesa las estructuras pendientes por lotes, con commit por lote."""
+        Quotation = self.sudo()
+        # Trabajos interrumpidos (p.ej. worker reiniciado) vuelven a la cola.
+        stale = fields.Datetime.subtract(fields.Datetime.now(), seconds=PROVISIONING_STALE_AFTER)
+        Quotation.search([
+            ('dossier_provisioning_state', '=', 'running'),
+            ('write_date', '<', stale),
+        ]).write({'dossier_provisioning_state': 'pending'})
+
+        started = time.monotonic()
+        while True:
+            quotations = Quotation.search([('dossier_provisioning_state', '=', 'pending')], limit=chunk_size, order='id')
+            if not quotations:
+                return
+            # "En curso" visible para los usuarios mientras se procesa el lote.
+            quotations.write({'dossier_provisioning_state': 'running'})
+            if auto_commit:
+                self.env.cr.commit()
+            quotations._sid_provision_dossier()
+            if auto_commit:
+                self.env.cr.commit()
+
+            if time.monotonic() - started > PROVISIONING_TIME_BUDGET:
+                cron = self.env.ref('sid_projects_dossier.ir_cron_sid_dossier_provisioning', raise_if_not_found=False)
+                if cron:
+                    cron._trigger()
+                return
+
+    # ---------------------------------------------------------------------
+    # Archivado (workspace "Archivado")
+    # ---------------------------------------------------------------------
+
+    def _sid_check_dossier_manager(self):
+        # Mueven subárboles completos con sudo/SQL: la restricción de grupo no
+        # puede depender solo de la acción de servidor (los métodos son RPC).
+        if not self.env.user.has_group('sid_projects_dossier.group_dossier_manager'):
+            raise AccessError(_('Solo los responsables de dossier pueden archivar o restaurar dossieres.'))
+
+    def action_archive_dossier(self):
+        self._sid_check_dossier_manager()
+        return self.env['sid.dossier.archive']._sid_archive_quotation_dossiers(self)
+
+    def action_restore_dossier(self):
+        self._sid_check_dossier_manager()
+        return self.env['sid.dossier.archive']._sid_restore_quotation_dossiers(self)
+
     def action_open_dossier_wizard_link(self):
         self.ensure_one()
         return {
@@ -224,6 +442,23 @@ class SaleOrderDossierRelated(models.Model):
         readonly=True,
     )
 
+    dossier_document_count = fields.Integer(
+        string='Documentos del dossier',
+        compute='_compute_dossier_stats',
+    )
+    dossier_progress = fields.Float(
+        string='Dossier completado (%)',
+        compute='_compute_dossier_stats',
+    )
+
+    @api.depends('dossier_folder_id')
+    def _compute_dossier_stats(self):
+        summary = self.env['sid.dossier.stat'].sudo()._sid_summary(self.mapped('dossier_folder_id').ids)
+        for so in self:
+            count, _approved, progress = summary.get(so.dossier_folder_id.id, (0, 0, 0.0))
+            so.dossier_document_count = count
+            so.dossier_progress = progress
+
     @api.depends('dossier_folder_id', 'x_dossier')
     def _compute_tiene_dossier(self):
         for so in self:
@@ -304,6 +539,35 @@ class SaleOrderDossierRelated(models.Model):
             },
         }
 
+    def action_enqueue_dossier_creation(self):
+        """Encola la creación/vinculación de dossier de los pedidos seleccionados."""
+        queue = self.env['sid.dossier.queue']._sid_enqueue(self.mapped('quotations_id'), sale_orders=self)
+        return queue.action_open()
+
+    @api.model
+    def _sid_recompute_dossier_fields(self, quotations):
+        """Recalcula en bloque los campos de dossier de los pedidos de la familia de `quotations`.
+
+        Principal y todas sus adendas se resuelven con dos búsquedas indexadas
+        (dossier_root_id, quotations_id); solo se marcan SID_ORDER_DOSSIER_FIELDS
+        en esos pedidos y se escriben con un flush agrupado.
+        """
+        Quotation = self.env['sale.quotations'].sudo()
+        quotations = quotations.sudo().exists()
+        if not quotations:
+            return self.browse()
+        roots = quotations.mapped('dossier_root_id') | quotations
+        family = quotations | Quotation.search([('dossier_root_id', 'in', roots.ids)])
+        orders = self.sudo().search([('quotations_id', 'in', family.ids)])
+        if not orders:
+            return orders
+        fnames = list(SID_ORDER_DOSSIER_FIELDS)
+        for fname in fnames:
+            self.env.add_to_compute(self._fields[fname], orders)
+        orders.recompute(fnames, orders)
+        orders.flush(fnames, orders)
+        return orders
+
     def action_open_dossier_wizard_link(self):
         self.ensure_one()
         return {
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+
+from . import sale_quotations
+from . import documents
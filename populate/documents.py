@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""Datos sintéticos: dossieres bajo las carpetas de año y documentos en sus estados.
+
+Los dossieres se crean con la misma taxonomía y los mismos pasos que
+`create_dossier_structure` (niveles, facetas, solicitudes), pero para muchos
+dossieres a la vez: un `create(vals_list)` por nivel y lote de dossieres en
+lugar de una llamada por dossier. Después se vinculan a contratos principales.
+Los documentos se reparten entre las subcarpetas de estado y se crean por
+lotes con `create(vals_list)`, de modo que las etiquetas y estadísticas se
+calculan con los mismos caminos por lotes que en producción.
+"""
+
+import logging
+from collections import defaultdict
+
+from odoo import fields, models
+from odoo.tools import populate
+
+from ..models.sid_dossier_template import DEFAULT_ESTADO_NAMES, _split_names
+from ..models.sid_projects_dossier_server_actions import (
+    _apply_facet_links,
+    _ensure_folder_level,
+    ensure_section_requests,
+)
+
+_logger = logging.getLogger(__name__)
+
+# Documentos por create(vals_list).
+POPULATE_BATCH_SIZE = 10000
+# Dossieres cuya estructura se crea a la vez (un create(vals_list) por nivel).
+POPULATE_DOSSIER_BATCH_SIZE = 500
+
+
+class DocumentsDocument(models.Model):
+    _inherit = 'documents.document'
+
+    _populate_sizes = {'small': 1000, 'medium': 100000, 'large': 2000000}
+    _populate_dependencies = ['sale.quotations']
+
+    # Nº de dossieres por tamaño de población.
+    _sid_populate_dossier_sizes = {'small': 10, 'medium': 500, 'large': 5000}
+
+    def _populate(self, size):
+        random = populate.Random('sid_dossier_documents')
+        dossiers = self._sid_populate_dossiers(self._sid_populate_dossier_sizes[size], random)
+        estado_folders = self.env['documents.folder'].sudo().search([
+            ('id', 'child_of', dossiers.ids),
+            ('name', 'in', list(_split_names(DEFAULT_ESTADO_NAMES))),
+        ]).ids
+        if not estado_folders:
+            return self.browse()
+
+        Document = self.sudo().with_context(tracking_disable=True)
+        total = self._populate_sizes[size]
+        created_ids = []
+        for start in range(0, total, POPULATE_BATCH_SIZE):
+            stop = min(start + POPULATE_BATCH_SIZE, total)
+            created_ids += Document.create([
+                {'name': 'SID-POP-%s.pdf' % i, 'folder_id': random.choice(estado_folders)}
+                for i in range(start, stop)
+            ]).ids
+            # Liberar caché entre lotes para mantener plana la memoria.
+            Document.flush()
+            Document.invalidate_cache()
+            _logger.info('documents.document populate: %s/%s', stop, total)
+        return self.browse(created_ids)
+
+    def _sid_populate_dossiers(self, count, random):
+        """Crea `count` dossieres repartidos por años y los vincula a contratos principales."""
+        Wizard = self.env['sid.dossier.assign.wizard']
+        Folder = self.env['documents.folder'].sudo()
+        this_year = fields.Date.today().year
+        years = [Wizard._ensure_year_folder(year) for year in range(this_year - 2, this_year + 1)]
+
+        dossiers = Folder.create([
+            {'name': 'SID-POP-DOSSIER-%05d' % i, 'parent_folder_id': random.choice(years).id}
+            for i in range(count)
+        ])
+        template = self.env['sid.dossier.template']._sid_get_compiled_template()
+        for start in range(0, count, POPULATE_DOSSIER_BATCH_SIZE):
+            stop = min(start + POPULATE_DOSSIER_BATCH_SIZE, count)
+            self._sid_populate_structures(dossiers[start:stop], template)
+            Folder.flush()
+            Folder.invalidate_cache()
+            _logger.info('documents.document populate: %s/%s dossier structures', stop, count)
+
+        principals = self.env['sale.quotations'].sudo().search(
+            [('parent_id', '=', False), ('dossier_folder_id', '=', False)], limit=count,
+        )
+        # Un write() por dossier con todos sus contratos, no uno por contrato.
+        principals_by_dossier = defaultdict(list)
+        for principal_id, dossier_id in zip(principals.ids, dossiers.ids):
+            principals_by_dossier[dossier_id].append(principal_id)
+        for dossier_id, principal_ids in principals_by_dossier.items():
+            principals.browse(principal_ids).write({'dossier_folder_id': dossier_id})
+        _logger.info('documents.document populate: %s dossiers, %s linked', len(dossiers), min(len(principals), count))
+        return dossiers
+
+    def _sid_populate_structures(self, dossiers, template):
+        """Estructura de `dossiers` recién creados, como create_dossier_structure pero en bloque.
+
+        Los dossieres están vacíos, así que el índice de carpetas existentes
+        empieza vacío y cada nivel se crea con un único create(vals_list).
+        """
+        Folder = self.env['documents.folder'].sudo()
+        index = {}
+        nodes = template.nodes
+        sections = _ensure_folder_level(Folder, index, [
+            (dossier.id, node.name, {'sequence': node.sequence})
+            for dossier in dossiers
+            for node in nodes
+        ])
+        # `sections` sigue el orden de las specs: len(nodes) secciones por dossier.
+        sections_by_dossier = [
+            (dossier, sections[i * len(nodes):(i + 1) * len(nodes)])
+            for i, dossier in enumerate(dossiers)
+        ]
+        _ensure_folder_level(Folder, index, [
+            (section.id, sub.name, {'sequence': sub.sequence} if sub.sequence is not None else {})
+            for _dossier, dossier_sections in sections_by_dossier
+            for node, section in zip(nodes, dossier_sections)
+            for sub in node.children
+        ])
+
+        # Facetas: un write por conjunto distinto de facetas para todo el lote.
+        facet_workspace = Folder._sid_quality_root()
+        if facet_workspace:
+            parent_facet_ids, section_facet_ids = self.env['sid.dossier.template']._sid_facet_map(
+                template.id, facet_workspace.id,
+            )
+            section_facet_ids = dict(section_facet_ids)
+            links = {}
+            for dossier, dossier_sections in sections_by_dossier:
+                links[dossier] = parent_facet_ids
+                for node, section in zip(nodes, dossier_sections):
+                    if node.match_facets:
+                        links[section] = section_facet_ids.get(node.name, ())
+            errors = []
+            _apply_facet_links(Folder, links, errors)
+            for error in errors:
+                _logger.warning('documents.document populate: %s', error)
+
+        request_sections = [
+            (dossier, Folder.browse([
+                section.id for node, section in zip(nodes, dossier_sections) if node.create_request
+            ]))
+            for dossier, dossier_sections in sections_by_dossier
+        ]
+        if template.request_mode == 'batch':
+            for dossier, dossier_sections in request_sections:
+                ensure_section_requests(self.env, dossier, dossier_sections)
+        elif template.request_mode == 'lazy' and self.env.get('documents.request') is not None:
+            Folder.browse([
+                section_id
+                for _dossier, dossier_sections in request_sections
+                for section_id in dossier_sections.ids
+            ]).write({'sid_request_pending': True})
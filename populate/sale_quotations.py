@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Datos sintéticos: jerarquías contrato principal / adendas en sale.quotations."""
+
+import logging
+from collections import defaultdict
+
+from odoo import models
+from odoo.tools import populate
+
+_logger = logging.getLogger(__name__)
+
+
+class SaleQuotations(models.Model):
+    _inherit = 'sale.quotations'
+
+    _populate_sizes = {'small': 50, 'medium': 2000, 'large': 20000}
+    _populate_dependencies = ['res.partner']
+
+    # Proporción de contratos que se convierten en adendas.
+    _sid_populate_adenda_ratio = 0.3
+
+    def _populate_factories(self):
+        factories = super()._populate_factories()
+        generated = {fname for fname, _generator in factories}
+        if 'name' not in generated:
+            factories.append(('name', populate.constant('SID-POP-{counter}')))
+        if 'partner_id' in self._fields and 'partner_id' not in generated:
+            partner_ids = self.env.registry.populated_models['res.partner']
+            factories.append(('partner_id', populate.randomize(partner_ids)))
+        return factories
+
+    def _populate(self, size):
+        records = super()._populate(size)
+        self._sid_populate_hierarchy(records)
+        return records
+
+    def _sid_populate_hierarchy(self, records):
+        """Convierte parte de los contratos en adendas de un principal del mismo cliente.
+
+        Se respeta `_check_parent_partner_consistency` (el padre es un contrato
+        principal del mismo cliente) y se escribe una vez por padre en lugar de
+        una vez por adenda.
+        """
+        random = populate.Random('sid_quotation_hierarchy')
+        has_partner = 'partner_id' in self._fields
+        principals = defaultdict(list)  # partner -> contratos principales ya generados
+        children_by_parent = defaultdict(list)
+
+        for quotation in records:
+            key = quotation.partner_id.id if has_partner else False
+            candidates = principals[key]
+            if candidates and random.random() < self._sid_populate_adenda_ratio:
+                children_by_parent[random.choice(candidates)].append(quotation.id)
+            else:
+                candidates.append(quotation.id)
+
+        for parent_id, child_ids in children_by_parent.items():
+            self.browse(child_ids).write({'parent_id': parent_id})
+        _logger.info('sale.quotations populate: %s adendas under %s parents',
+                     sum(len(ids) for ids in children_by_parent.values()), len(children_by_parent))
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+from . import test_query_plans
+from . import test_query_budgets
+from . import test_dossier_archive
+from . import test_dossier_stat
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Datos de prueba compartidos: root/año/dossier con estructura, contratos y documentos."""
+
+from itertools import count
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+from ..models.sid_projects_dossier_server_actions import create_dossier_structure
+
+
+class SidDossierCase(TransactionCase):
+
+    _sid_sequence = count()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Folder = cls.env['documents.folder'].sudo()
+        cls.Quotation = cls.env['sale.quotations'].sudo()
+        cls.Document = cls.env['documents.document'].sudo()
+        cls.partner = cls.env['res.partner'].create({'name': 'SID Dossier Test'})
+
+        cls.year_folder = cls.env['sid.dossier.assign.wizard']._ensure_year_folder(fields.Date.today().year)
+        cls.dossiers = cls.Folder.create([
+            {'name': 'SID-TEST-DOSSIER-%02d' % i, 'parent_folder_id': cls.year_folder.id}
+            for i in range(3)
+        ])
+        for dossier in cls.dossiers:
+            create_dossier_structure(cls.env, dossier)
+
+        cls.principals = cls._sid_create_quotations(3)
+        for principal, dossier in zip(cls.principals, cls.dossiers):
+            principal.write({'dossier_folder_id': dossier.id})
+        cls.adendas = cls._sid_create_quotations(5, parent=cls.principals[0])
+
+        cls.estado_folders = cls.Folder.search([
+            ('id', 'child_of', cls.dossiers.ids),
+            ('name', 'in', ['Proveedor', 'Aprobado']),
+        ])
+        cls.documents = cls.Document.create([
+            {'name': 'SID-TEST-%03d.pdf' % i, 'folder_id': cls.estado_folders[i % len(cls.estado_folders)].id}
+            for i in range(30)
+        ])
+
+    @classmethod
+    def _sid_create_quotations(cls, size, parent=None):
+        vals_list = []
+        for _i in range(size):
+            vals = {'name': 'SID-TEST-%s-%04d' % ('ADENDA' if parent else 'CONTRATO', next(cls._sid_sequence))}
+            if 'partner_id' in cls.Quotation._fields:
+                vals['partner_id'] = cls.partner.id
+            if parent:
+                vals['parent_id'] = parent.id
+            vals_list.append(vals)
+        return cls.Quotation.create(vals_list)
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+
+from odoo.exceptions import AccessError
+from odoo.tests.common import new_test_user, tagged
+
+from ..models.documents_folder_xmlid import normalize_folder_name
+from .common import SidDossierCase
+
+
+@tagged('post_install', '-at_install')
+class TestDossierArchive(SidDossierCase):
+
+    def setUp(self):
+        super().setUp()
+        self.Archive = self.env['sid.dossier.archive']
+        self.dossier = self.dossiers[0]
+        self.dossier_documents = self.documents.filtered(lambda doc: doc.dossier_folder_id == self.dossier)
+
+    def test_archive_keeps_links_and_stats(self):
+        Stat = self.env['sid.dossier.stat']
+        summary = Stat._sid_summary(self.dossier.ids)
+        self.Archive._sid_archive_dossiers(self.dossier)
+
+        workspace = self.env.ref('sid_projects_dossier.sid_workspace_archived')
+        self.assertTrue(self.dossier.parent_path.startswith('%s/' % workspace.id))
+        self.assertTrue(self.dossier.is_dossier_folder)
+        self.assertTrue(self.dossier.dossier_archived)
+        self.assertEqual(self.principals[0].dossier_effective_folder_id, self.dossier)
+        self.assertEqual(self.dossier_documents.dossier_folder_id, self.dossier)
+        self.assertEqual(Stat._sid_summary(self.dossier.ids), summary)
+
+    def test_archived_dossier_found_as_duplicate(self):
+        self.Archive._sid_archive_dossiers(self.dossier)
+        found = self.Folder.search([
+            ('is_dossier_folder', '=', True),
+            ('normalized_name', '=', normalize_folder_name(self.dossier.name)),
+        ])
+        self.assertEqual(found, self.dossier)
+
+    def test_restore(self):
+        year_folder = self.dossier.parent_folder_id
+        self.Archive._sid_archive_dossiers(self.dossier)
+        self.Archive._sid_restore_dossiers(self.dossier)
+
+        self.assertEqual(self.dossier.parent_folder_id, year_folder)
+        self.assertFalse(self.dossier.dossier_archived)
+        sections = self.Folder.search([('parent_folder_id', '=', self.dossier.id)])
+        self.assertTrue(sections)
+        for section in sections:
+            self.assertTrue(section.parent_path.startswith(self.dossier.parent_path))
+        self.assertEqual(self.dossier_documents.dossier_folder_id, self.dossier)
+
+    def test_cron_archives_old_approved_dossiers_once(self):
+        quotations = self.Quotation.search([('dossier_effective_folder_id', '=', self.dossier.id)])
+        quotations.write({'dossier_state': 'aprobado'})
+        self.env['base'].flush()
+        cr = self.env.cr
+        cr.execute("UPDATE documents_folder SET create_date = now() - interval '2 years' WHERE id = %s", (self.dossier.id,))
+        cr.execute(
+            "UPDATE documents_document SET write_date = now() - interval '2 years' WHERE dossier_folder_id = %s",
+            (self.dossier.id,),
+        )
+        self.assertEqual(self.Archive._sid_archivable_dossier_ids(age_days=365), [self.dossier.id])
+
+        self.Archive._cron_archive_dossiers(auto_commit=False)
+        self.assertTrue(self.dossier.dossier_archived)
+        self.assertEqual(self.Archive._sid_archivable_dossier_ids(age_days=365), [])
+
+    def test_archive_requires_manager(self):
+        user = new_test_user(self.env, login='sid_dossier_plain_user', groups='base.group_user')
+        with self.assertRaises(AccessError):
+            self.principals[0].with_user(user).action_archive_dossier()
+        with self.assertRaises(AccessError):
+            self.principals[0].with_user(user).action_restore_dossier()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+from odoo.tests.common import tagged
+
+from .common import SidDossierCase
+
+
+@tagged('post_install', '-at_install')
+class TestDossierStat(SidDossierCase):
+
+    def _sid_stat_rows(self):
+        self.env['base'].flush()
+        self.env.cr.execute("""
+            SELECT dossier_folder_id, section_folder_id, estado, document_count
+              FROM sid_dossier_stat
+        """)
+        return sorted(self.env.cr.fetchall(), key=repr)
+
+    def test_deltas_match_rebuild(self):
+        Stat = self.env['sid.dossier.stat']
+        documents = self.documents
+        source = documents[0].folder_id
+        sibling = self.Folder.search([
+            ('parent_folder_id', '=', source.parent_folder_id.id),
+            ('id', '!=', source.id),
+        ], limit=1)
+        other_dossier = self.Folder.search([
+            ('id', 'child_of', self.dossiers[2].id),
+            ('name', '=', 'Aprobado'),
+        ], limit=1)
+
+        # Cambio de estado dentro del dossier y cambio de dossier.
+        documents[:5].write({'folder_id': sibling.id})
+        documents[5:8].write({'folder_id': other_dossier.id})
+        # Archivar y desarchivar.
+        documents[8:12].write({'active': False})
+        documents[10:12].write({'active': True})
+        # Borrado y alta.
+        documents[12:15].unlink()
+        self.Document.create([
+            {'name': 'SID-TEST-NEW-%s.pdf' % i, 'folder_id': sibling.id}
+            for i in range(3)
+        ])
+
+        incremental = self._sid_stat_rows()
+        summary = Stat._sid_summary(self.dossiers.ids)
+        Stat._sid_rebuild()
+        self.assertEqual(self._sid_stat_rows(), incremental)
+        self.assertEqual(Stat._sid_summary(self.dossiers.ids), summary)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""Presupuestos de consultas de los caminos críticos del dossier.
+
+Cada test mide un escenario con `assertQueryCount` sobre los datos sembrados
+de `SidDossierCase` y falla si supera su presupuesto. Al terminar la clase, el
+nº de consultas y el tiempo de reloj por escenario se vuelcan a un JSON
+(ruta en SID_DOSSIER_BENCHMARK_OUTPUT) para comparar versiones.
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from odoo import fields
+from odoo.tests.common import tagged
+
+from ..hooks import _backfill_column_sql, _backfill_tiene_dossier_sql, _bind_existing_folders
+from ..models.sid_projects_dossier_server_actions import create_dossier_structure
+from .common import SidDossierCase
+
+DEFAULT_OUTPUT_PATH = '/tmp/sid_dossier_benchmark.json'
+OUTPUT_PATH_ENV = 'SID_DOSSIER_BENCHMARK_OUTPUT'
+
+# Presupuesto máximo de consultas por escenario.
+QUERY_BUDGETS = {
+    'action_confirm_new': 150,
+    'action_confirm_existing': 110,
+    'create_dossier_structure_empty': 130,
+    'create_dossier_structure_complete': 70,
+    'sync_tags_1': 16,
+    'sync_tags_100': 24,
+    'sync_tags_1000': 40,
+    'reparent_adendas_100': 40,
+    'hooks': 40,
+}
+
+
+@tagged('post_install', '-at_install')
+class TestQueryBudgets(SidDossierCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.results = []
+        cls.module_version = cls.env['ir.module.module'].search(
+            [('name', '=', 'sid_projects_dossier')], limit=1,
+        ).latest_version
+
+    @classmethod
+    def tearDownClass(cls):
+        report = {
+            'module_version': cls.module_version,
+            'database': cls.env.cr.dbname,
+            'timestamp': fields.Datetime.to_string(fields.Datetime.now()),
+            'results': sorted(cls.results, key=lambda result: result['scenario']),
+        }
+        with open(os.environ.get(OUTPUT_PATH_ENV, DEFAULT_OUTPUT_PATH), 'w') as output:
+            json.dump(report, output, indent=2)
+        super().tearDownClass()
+
+    @contextmanager
+    def _sid_budget(self, scenario):
+        """assertQueryCount del escenario, con caché fría, registrando el resultado."""
+        budget = QUERY_BUDGETS[scenario]
+        self.env['base'].flush()
+        self.env['base'].invalidate_cache()
+        cr = self.env.cr
+        with self.assertQueryCount(budget):
+            start_count = cr.sql_log_count
+            start = time.perf_counter()
+            yield
+            self.env['base'].flush()
+            queries = cr.sql_log_count - start_count
+            self.results.append({
+                'scenario': scenario,
+                'budget': budget,
+                'queries': queries,
+                'wall_ms': round((time.perf_counter() - start) * 1000.0, 2),
+                'passed': queries <= budget,
+            })
+
+    def _sid_wizard(self, quotation, mode, folder=None):
+        context = {'default_quotation_id': quotation.id, 'default_mode': mode}
+        if folder:
+            context['default_existing_folder_id'] = folder.id
+        return self.env['sid.dossier.assign.wizard'].with_context(**context).create({})
+
+    # ---------------------------------------------------------------------
+    # Wizard y estructura
+    # ---------------------------------------------------------------------
+
+    def test_action_confirm_new(self):
+        quotation = self._sid_create_quotations(1)
+        wizard = self._sid_wizard(quotation, 'new')
+        with self._sid_budget('action_confirm_new'):
+            wizard.action_confirm()
+        self.assertTrue(quotation.dossier_folder_id)
+
+    def test_action_confirm_existing(self):
+        principal = self.principals[0]
+        wizard = self._sid_wizard(principal, 'existing', principal.dossier_folder_id)
+        with self._sid_budget('action_confirm_existing'):
+            wizard.action_confirm()
+        self.assertEqual(principal.dossier_folder_id, self.dossiers[0])
+
+    def test_create_dossier_structure_empty(self):
+        dossier = self.Folder.create({'name': 'SID-TEST-EMPTY', 'parent_folder_id': self.year_folder.id})
+        with self._sid_budget('create_dossier_structure_empty'):
+            create_dossier_structure(self.env, dossier)
+        self.assertTrue(self.Folder.search_count([('parent_folder_id', '=', dossier.id)]))
+
+    def test_create_dossier_structure_complete(self):
+        with self._sid_budget('create_dossier_structure_complete'):
+            create_dossier_structure(self.env, self.dossiers[0])
+
+    # ---------------------------------------------------------------------
+    # Documentos: etiquetas al cambiar de subcarpeta de estado
+    # ---------------------------------------------------------------------
+
+    def _sid_check_move_documents(self, size):
+        # create() ya sincroniza las etiquetas: se mide el cambio de carpeta,
+        # que vuelve a sincronizarlas y actualiza las estadísticas.
+        source = self.Folder.search([('id', 'child_of', self.dossiers[1].id), ('name', '=', 'Proveedor')], limit=1)
+        target = self.Folder.search([('parent_folder_id', '=', source.parent_folder_id.id), ('name', '=', 'Aprobado')])
+        documents = self.Document.create([
+            {'name': 'SID-TEST-MOVE-%s.pdf' % i, 'folder_id': source.id}
+            for i in range(size)
+        ])
+        with self._sid_budget('sync_tags_%s' % size):
+            documents.write({'folder_id': target.id})
+        self.assertEqual(documents.folder_id, target)
+
+    def test_sync_tags_1(self):
+        self._sid_check_move_documents(1)
+
+    def test_sync_tags_100(self):
+        self._sid_check_move_documents(100)
+
+    def test_sync_tags_1000(self):
+        self._sid_check_move_documents(1000)
+
+    # ---------------------------------------------------------------------
+    # Jerarquía de contratos
+    # ---------------------------------------------------------------------
+
+    def test_reparent_adendas(self):
+        # Las adendas cuelgan siempre de un principal (_check_parent_partner_consistency):
+        # el caso caro es mover una familia ancha, no una cadena profunda.
+        adendas = self._sid_create_quotations(100, parent=self.principals[0])
+        with self._sid_budget('reparent_adendas_100'):
+            adendas.write({'parent_id': self.principals[1].id})
+        self.assertEqual(adendas.mapped('dossier_root_id'), self.principals[1])
+        self.assertEqual(adendas.mapped('dossier_effective_folder_id'), self.dossiers[1])
+
+    # ---------------------------------------------------------------------
+    # Hooks de instalación
+    # ---------------------------------------------------------------------
+
+    def test_hooks(self):
+        cr = self.env.cr
+        with self._sid_budget('hooks'):
+            _bind_existing_folders(cr)
+            _backfill_tiene_dossier_sql(cr, auto_commit=False)
+            _backfill_column_sql(cr, 'documents_document', 'document_description', 'x_name_2', auto_commit=False)
+            _backfill_column_sql(cr, 'documents_document', 'document_transmittal', 'x_transmittal', auto_commit=False)
+            self.env['sid.dossier.stat']._sid_rebuild()
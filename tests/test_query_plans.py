@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+from unittest.mock import patch
+
+import psycopg2
+
+from odoo.tests.common import tagged
+from odoo.tools import mute_logger
+
+from ..models import sid_dossier_indexes
+from .common import SidDossierCase
+
+
+@tagged('post_install', '-at_install')
+class TestQueryPlans(SidDossierCase):
+
+    def test_critical_queries_use_indexes(self):
+        self.env['base'].flush()
+        self.assertEqual(self.env['sid.dossier.index.plan']._sid_check_query_plans(), [])
+
+    def test_failed_explain_raises_original_error(self):
+        broken = [('broken', 'SELECT sid_missing_column FROM documents_folder', (), ('documents_folder',))]
+        with patch.object(sid_dossier_indexes, 'SID_CRITICAL_QUERIES', broken), mute_logger('odoo.sql_db'):
+            with self.assertRaises(psycopg2.ProgrammingError):
+                self.env['sid.dossier.index.plan']._sid_check_query_plans()
+        self.env.cr.execute("SHOW enable_seqscan")
+        self.assertEqual(self.env.cr.fetchone()[0], 'on')